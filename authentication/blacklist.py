@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+# Every blacklisted jti is appended here so each process can add it to its
+# own filter without reading the blacklist table.
+BLACKLIST_STREAM = 'auth:blacklist'
+
+
+def parse_stream_id(entry_id):
+    milliseconds, sequence = entry_id.split(b'-')
+    return int(milliseconds), int(sequence)
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives and an ``error_rate`` share of
+    false positives once ``capacity`` items have been added.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def get_positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest.
+        digest = hashlib.sha256(item.encode()).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self.get_positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self.get_positions(item))
+
+
+class BlacklistFilter:
+    """
+    Per-process bloom filter of blacklisted refresh token JTIs.
+
+    The filter is built from the unexpired rows of the blacklist table and
+    then kept current by reading new entries from the Redis stream before
+    each check. A jti the filter has never seen cannot be blacklisted, so
+    only possible positives are confirmed against the database. Bloom
+    filters can't forget, so the filter is rebuilt every
+    ``BLACKLIST_FILTER_REBUILD_INTERVAL`` seconds to shed expired tokens.
+
+    Without Redis, other processes' blacklistings would be missed, so every
+    check goes to the database instead.
+
+    A jti that can't be published is kept and published again before
+    this process's next check, so a Redis outage only delays it. Only a
+    process that exits first leaves it to the others' next rebuild.
+    """
+
+    def __init__(self):
+        self.client = redis.Redis.from_url(
+            settings.BLACKLIST_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.lock = threading.Lock()
+        self.filter = None
+        self.built_at = None
+        self.last_id = None
+        # Blacklisted here but not yet in the stream.
+        self.unpublished = []
+
+    def publish(self, jti):
+        with self.lock:
+            self.unpublished.append(jti)
+        for attempt in range(settings.BLACKLIST_PUBLISH_ATTEMPTS):
+            if attempt:
+                time.sleep(settings.BLACKLIST_PUBLISH_BACKOFF * 2 ** (attempt - 1))
+            try:
+                with self.lock:
+                    self.publish_unpublished()
+                return
+            except redis.RedisError as e:
+                error = e
+        logger.error(f"Failed to publish blacklisted token {jti}, will retry before the next check: {error}")
+
+    def publish_unpublished(self):
+        if not self.unpublished:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for jti in self.unpublished:
+            pipe.xadd(BLACKLIST_STREAM, {'jti': jti},
+                      maxlen=settings.BLACKLIST_STREAM_MAXLEN, approximate=True)
+        # A partial failure publishes some twice on the retry, which is
+        # harmless.
+        pipe.execute()
+        self.unpublished = []
+
+    def rebuild(self):
+        # Read the stream position first: entries added while the table is
+        # read are applied again on the next sync, which is harmless.
+        entries = self.client.xrevrange(BLACKLIST_STREAM, count=1)
+        last_id = entries[0][0] if entries else b'0-0'
+        jtis = BlacklistedToken.objects.filter(
+            token__expires_at__gt=timezone.now()).values_list('token__jti', flat=True)
+        bloom = BloomFilter(settings.BLACKLIST_FILTER_CAPACITY,
+                            settings.BLACKLIST_FILTER_ERROR_RATE)
+        for jti in jtis.iterator(chunk_size=10000):
+            bloom.add(jti)
+        self.filter, self.last_id, self.built_at = bloom, last_id, time.monotonic()
+
+    def sync(self):
+        self.publish_unpublished()
+        if (self.filter is None or time.monotonic() - self.built_at
+                >= settings.BLACKLIST_FILTER_REBUILD_INTERVAL):
+            self.rebuild()
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.xrange(BLACKLIST_STREAM, count=1)
+        pipe.xread({BLACKLIST_STREAM: self.last_id})
+        first, new = pipe.execute()
+        if (first and self.last_id != b'0-0'
+                and parse_stream_id(first[0][0]) > parse_stream_id(self.last_id)):
+            # Entries we hadn't read yet were trimmed from the stream.
+            self.rebuild()
+            return
+        for _stream, entries in new:
+            for entry_id, fields in entries:
+                self.filter.add(fields[b'jti'].decode())
+                self.last_id = entry_id
+
+    def might_contain(self, jti):
+        try:
+            with self.lock:
+                self.sync()
+                return jti in self.filter
+        except redis.RedisError as e:
+            logger.warning(f"Blacklist stream unavailable, checking the database: {e}")
+            return True
+
+
+@lru_cache(maxsize=None)
+def get_blacklist_filter():
+    if settings.BLACKLIST_REDIS_URL:
+        return BlacklistFilter()
+    return None
+
+
+def might_be_blacklisted(jti):
+    blacklist_filter = get_blacklist_filter()
+    return blacklist_filter is None or blacklist_filter.might_contain(jti)
+
+
+def publish_blacklisted(jti):
+    """Announce a newly blacklisted jti to every process's filter."""
+    blacklist_filter = get_blacklist_filter()
+    if blacklist_filter is not None:
+        blacklist_filter.publish(jti)
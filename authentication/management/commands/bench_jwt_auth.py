@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.models import CustomUser
+from authentication.tokens import ClaimsJWTAuthentication, ClaimsRefreshToken
+
+
+class Command(BaseCommand):
+    help = "Compare requests per second through database-backed and claims-based JWT authentication."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--email',
+                            help="User to issue tokens for; defaults to the first active user.")
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.filter(is_active=True)
+        if options['email']:
+            users = users.filter(email=options['email'])
+        user = users.order_by('date_joined').first()
+        if user is None:
+            raise CommandError("No active user to issue tokens for.")
+
+        results = [
+            ('simplejwt, user query per request', JWTAuthentication,
+             RefreshToken.for_user(user).access_token),
+            ('signed claims, lazy user', ClaimsJWTAuthentication,
+             ClaimsRefreshToken.for_user(user).access_token),
+        ]
+        factory = APIRequestFactory()
+        for name, authentication_class, token in results:
+            view = self.get_view(authentication_class)
+            header = f'Bearer {token}'
+            started = time.perf_counter()
+            for _ in range(options['requests']):
+                response = view(factory.get('/', HTTP_AUTHORIZATION=header))
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{name:<36} {options['requests'] / elapsed:10.0f} requests/sec")
+
+    def get_view(self, authentication_class):
+        class BenchView(APIView):
+            authentication_classes = [authentication_class]
+            permission_classes = [IsAuthenticated]
+
+            def get(self, request):
+                return Response({'id': str(request.user.pk), 'is_staff': request.user.is_staff})
+
+        return BenchView.as_view()
@@ -1,8 +1,131 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
 import requests
 from jose import jwt
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework import authentication, exceptions
 
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+OKTA_USER_KEY = 'okta:user:{sub}'
+
+
+class JWKSCache:
+    """
+    Okta's signing keys by ``kid``.
+
+    The key set is fetched once and refetched after ``ttl`` seconds. A
+    token signed with a key we don't know also triggers a refetch, since
+    Okta may have rotated its keys, but at most once every
+    ``min_refresh`` seconds so that forged ``kid`` values cannot make every
+    request call Okta.
+    """
+
+    def __init__(self, url, ttl, min_refresh):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self.keys = {}
+        self.fetched_at = None
+        self.lock = threading.Lock()
+
+    def get_key(self, kid):
+        now = time.monotonic()
+        key = self.keys.get(kid)
+        if self.fetched_at is None or now - self.fetched_at >= self.ttl:
+            key = self.refresh(now).get(kid)
+        elif key is None and now - self.fetched_at >= self.min_refresh:
+            key = self.refresh(now).get(kid)
+        return key
+
+    def refresh(self, now):
+        with self.lock:
+            # Another thread may have refreshed while we waited.
+            if self.fetched_at is not None and now <= self.fetched_at:
+                return self.keys
+            try:
+                response = requests.get(self.url, timeout=5)
+                response.raise_for_status()
+                self.keys = {key['kid']: key for key in response.json()['keys']}
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                # Keep the keys we have; they are still valid for tokens
+                # Okta signed before any rotation.
+                logger.error(f"Failed to fetch Okta JWKS from {self.url}: {e}")
+            self.fetched_at = time.monotonic()
+            return self.keys
+
+
+class ClaimsCache:
+    """
+    Bounded LRU of verified token claims, keyed by a hash of the token and
+    kept no longer than the token's ``exp``.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_key(self, token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        key = self.get_key(token)
+        with self.lock:
+            claims = self.entries.get(key)
+            if claims is None:
+                return None
+            if claims['exp'] <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return claims
+
+    def set(self, token, claims):
+        if 'exp' not in claims:
+            return
+        key = self.get_key(token)
+        with self.lock:
+            self.entries[key] = claims
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+@lru_cache(maxsize=None)
+def get_jwks_cache():
+    return JWKSCache(settings.OKTA_JWKS_URL, settings.OKTA_JWKS_TTL,
+                     settings.OKTA_JWKS_MIN_REFRESH)
+
+
+@lru_cache(maxsize=None)
+def get_claims_cache():
+    return ClaimsCache(settings.OKTA_CLAIMS_CACHE_SIZE)
+
+
+def get_okta_user(sub):
+    """
+    Return the active CustomUser whose ``OKTA_USER_FIELD`` matches ``sub``.
+    Users are cached for ``OKTA_USER_CACHE_TIMEOUT`` seconds and dropped
+    from the cache when saved.
+    """
+    key = OKTA_USER_KEY.format(sub=sub)
+    user = cache.get(key)
+    if user is None:
+        user = CustomUser.objects.filter(
+            **{settings.OKTA_USER_FIELD: sub}, is_active=True).first()
+        if user is not None:
+            cache.set(key, user, settings.OKTA_USER_CACHE_TIMEOUT)
+    return user
+
 
 class OktaAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
@@ -24,14 +147,28 @@ class OktaAuthentication(authentication.BaseAuthentication):
         return self._validate_token(token)
 
     def _validate_token(self, token):
+        claims_cache = get_claims_cache()
+        decoded_token = claims_cache.get(token)
+        if decoded_token is None:
+            decoded_token = self._decode_token(token)
+            claims_cache.set(token, decoded_token)
+
+        user = get_okta_user(decoded_token['sub'])
+        if user is None:
+            raise exceptions.AuthenticationFailed('User not found')
+        return (user, token)
+
+    def _decode_token(self, token):
         try:
-            # Decode the token to verify its signature
-            decoded_token = jwt.decode(token, settings.OKTA_CLIENT_SECRET,
-                                       audience=settings.OKTA_AUDIENCE, issuer=settings.OKTA_ISSUER)
-            user_id = decoded_token['sub']
-            # Optionally, you can fetch the user from your database
-            # user = User.objects.get(id=user_id)
-            return (user_id, token)
+            kid = jwt.get_unverified_header(token).get('kid')
+            key = get_jwks_cache().get_key(kid)
+            if key is None:
+                raise exceptions.AuthenticationFailed('Unknown signing key')
+            # Verify the signature against Okta's published key
+            return jwt.decode(token, key, algorithms=settings.OKTA_ALGORITHMS,
+                              audience=settings.OKTA_AUDIENCE, issuer=settings.OKTA_ISSUER)
+        except exceptions.AuthenticationFailed:
+            raise
         except jwt.ExpiredSignatureError:
             raise exceptions.AuthenticationFailed('Token has expired')
         except jwt.JWTClaimsError:
@@ -39,5 +176,3 @@ class OktaAuthentication(authentication.BaseAuthentication):
         except Exception as e:
             raise exceptions.AuthenticationFailed(
                 'Failed to authenticate token')
-
-        return None
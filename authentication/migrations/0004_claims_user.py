@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-18 12:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "authentication",
+            "0003_customuser_dob_customuser_gender_customuser_language_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClaimsUser",
+            fields=[],
+            options={
+                "proxy": True,
+                "indexes": [],
+                "constraints": [],
+            },
+            bases=("authentication.customuser",),
+        ),
+    ]
@@ -56,3 +56,45 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     def __str__(self):
         return str(self.email)
+
+
+class ClaimsUser(CustomUser):
+    """
+    A CustomUser built from signed access token claims without a query.
+
+    Only the fields carried in the token are loaded; every other field is
+    deferred, and touching any of them loads the rest of the row once.
+    Saving writes only the fields the caller changed, so claims that went
+    stale since the token was issued are never written back.
+    """
+    CLAIM_FIELDS = ('id', 'email', 'is_staff', 'is_superuser', 'is_active')
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, claims):
+        user = cls.from_db(
+            'default', list(cls.CLAIM_FIELDS),
+            [uuid.UUID(str(claims['user_id'])), claims['email'], claims['is_staff'],
+             claims['is_superuser'], True])
+        user.membership_type = claims.get('membership_type')
+        user._claims = {field: getattr(user, field) for field in cls.CLAIM_FIELDS}
+        return user
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using, fields, **kwargs)
+
+    def save(self, *args, **kwargs):
+        claims = getattr(self, '_claims', None)
+        if claims is not None and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and (field.attname not in claims
+                     or getattr(self, field.attname) != claims[field.attname])]
+        super().save(*args, **kwargs)
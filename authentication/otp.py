@@ -0,0 +1,86 @@
+import abc
+import hmac
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import salted_hmac
+from django.utils.module_loading import import_string
+
+# Outcomes of OTPStore.verify().
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+LOCKED = 'locked'
+
+
+def generate_otp(length=None):
+    length = length or settings.OTP_LENGTH
+    return str(secrets.randbelow(10 ** length)).zfill(length)
+
+
+class OTPStore(abc.ABC):
+    """
+    One-time passwords keyed by an identifier such as an email address.
+
+    Codes expire after ``OTP_TTL`` seconds, allow ``OTP_MAX_ATTEMPTS``
+    guesses, and can be verified only once.
+    """
+
+    @abc.abstractmethod
+    def issue(self, identifier):
+        """Create, store and return a new code, replacing any previous one."""
+
+    @abc.abstractmethod
+    def verify(self, identifier, otp):
+        """Return VERIFIED, INVALID, EXPIRED or LOCKED."""
+
+
+class CacheOTPStore(OTPStore):
+    """
+    OTP store on a Django cache, shared by every worker when the cache is
+    Redis. Only a keyed hash of each code is stored, and it is compared in
+    constant time.
+    """
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or settings.OTP_CACHE_ALIAS]
+
+    def get_keys(self, identifier):
+        identifier = str(identifier).strip().lower()
+        return f'otp:{identifier}', f'otp:{identifier}:attempts'
+
+    def hash_otp(self, otp):
+        return salted_hmac('authentication.otp', str(otp), algorithm='sha256').hexdigest()
+
+    def issue(self, identifier):
+        otp = generate_otp()
+        code_key, attempts_key = self.get_keys(identifier)
+        self.cache.set_many(
+            {code_key: self.hash_otp(otp), attempts_key: 0}, timeout=settings.OTP_TTL)
+        return otp
+
+    def verify(self, identifier, otp):
+        code_key, attempts_key = self.get_keys(identifier)
+        digest = self.cache.get(code_key)
+        if digest is None:
+            return EXPIRED
+        try:
+            # incr is atomic, so concurrent guesses cannot share an attempt.
+            attempts = self.cache.incr(attempts_key)
+        except ValueError:
+            return EXPIRED
+        if attempts > settings.OTP_MAX_ATTEMPTS:
+            self.cache.delete_many([code_key, attempts_key])
+            return LOCKED
+        if not hmac.compare_digest(digest, self.hash_otp(otp)):
+            return INVALID
+        # Whoever deletes the code first wins, so it verifies only once.
+        if not self.cache.delete(code_key):
+            return EXPIRED
+        self.cache.delete(attempts_key)
+        return VERIFIED
+
+
+def get_otp_store():
+    return import_string(settings.OTP_STORE)()
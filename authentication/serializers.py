@@ -7,6 +7,10 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate
 from rest_framework.validators import ValidationError
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .tokens import ClaimsRefreshToken
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
@@ -40,6 +44,24 @@ class TokenVerifyResponseSerializer(serializers.Serializer):
         raise NotImplementedError()
 
 
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        # Re-read the claims so a refresh picks up changes to the user.
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(
+            pk=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed("User not found or inactive.", code='user_inactive')
+        refresh.set_user_claims(user)
+        return super().validate({**attrs, 'refresh': str(refresh)})
+
+
 class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -1,11 +1,16 @@
 from .models import *
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from .blacklist import publish_blacklisted
+from .middleware import OKTA_USER_KEY
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django_rest_passwordreset.signals import reset_password_token_created
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from mailer.outbox import queue_email
+from mailer.rendering import render_email
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,11 +27,42 @@ def password_reset_token_created(sender, instance, reset_password_token, *args,
             'titanium_training_user':  f"{reset_password_token.user.email}",
             'otp': f" {reset_password_token.key} "
         }
-        html_body = render_to_string("otp_mail.html", merge_data)
-        msg = EmailMultiAlternatives(subject="Titanium Training Password Reset", from_email=settings.EMAIL_HOST_USER, to=[
-                                     reset_password_token.user.email], body=" ",)
-        msg.attach_alternative(html_body, "text/html")
-        msg.send(fail_silently=False)
+        html_body = render_email("emails/otp_mail.html", merge_data)
+        queue_email(subject="Titanium Training Password Reset", from_email=settings.EMAIL_HOST_USER, to=[
+                    reset_password_token.user.email], html_body=html_body)
 
     except Exception as e:
-        logger.error(f"Error sending password reset email: {e}")
+        logger.error(f"Error queueing password reset email: {e}")
+
+
+# OKTA USER CACHE
+@receiver(pre_save, sender=CustomUser)
+@receiver(pre_save, sender=ClaimsUser)
+def remember_okta_user_sub(sender, instance, update_fields=None, *args, **kwargs):
+    # Users are cached under their OKTA_USER_FIELD, so a save that changes
+    # it must drop the key for the stored value too. It is read from the
+    # database because a ClaimsUser's copy can be older than the row.
+    field = settings.OKTA_USER_FIELD
+    instance._previous_okta_sub = None
+    if instance._state.adding or (update_fields is not None and field not in update_fields):
+        return
+    instance._previous_okta_sub = CustomUser.objects.filter(
+        pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_save, sender=ClaimsUser)
+@receiver(post_delete, sender=ClaimsUser)
+def drop_cached_okta_user(sender, instance, *args, **kwargs):
+    subs = {getattr(instance, settings.OKTA_USER_FIELD),
+            getattr(instance, '_previous_okta_sub', None)} - {None}
+    cache.delete_many([OKTA_USER_KEY.format(sub=sub) for sub in subs])
+
+
+# TOKEN BLACKLIST FILTERS
+@receiver(post_save, sender=BlacklistedToken)
+def publish_blacklisted_token(sender, instance, created, **kwargs):
+    if created:
+        jti = instance.token.jti
+        transaction.on_commit(lambda: publish_blacklisted(jti))
@@ -1,3 +1,381 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+import fakeredis
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from jose import jwk, jwt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import blacklist, middleware, otp, throttling
+from .models import ClaimsUser, CustomUser
+from .serializers import ClaimsTokenRefreshSerializer
+from .tokens import ClaimsJWTAuthentication, ClaimsRefreshToken
+
+
+@override_settings(OTP_MAX_ATTEMPTS=3)
+class CacheOTPStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = otp.CacheOTPStore()
+
+    def test_code_verifies_once(self):
+        code = self.store.issue('Student@Example.com')
+
+        self.assertEqual(len(code), 6)
+        self.assertEqual(self.store.verify('student@example.com', code), otp.VERIFIED)
+        self.assertEqual(self.store.verify('student@example.com', code), otp.EXPIRED)
+
+    def test_code_is_not_stored_in_clear(self):
+        code = self.store.issue('student@example.com')
+
+        self.assertNotEqual(cache.get('otp:student@example.com'), code)
+
+    def test_too_many_attempts_lock_the_code(self):
+        code = self.store.issue('student@example.com')
+        for _ in range(3):
+            self.assertEqual(self.store.verify('student@example.com', 'wrong'), otp.INVALID)
+
+        self.assertEqual(self.store.verify('student@example.com', code), otp.LOCKED)
+        self.assertEqual(self.store.verify('student@example.com', code), otp.EXPIRED)
+
+    def test_new_code_replaces_old_one(self):
+        old = self.store.issue('student@example.com')
+        self.store.verify('student@example.com', 'wrong')
+        new = self.store.issue('student@example.com')
+
+        if old != new:
+            self.assertEqual(self.store.verify('student@example.com', old), otp.INVALID)
+        self.assertEqual(self.store.verify('student@example.com', new), otp.VERIFIED)
+
+    def test_expired_code_is_rejected(self):
+        code = self.store.issue('student@example.com')
+        # Simulate the cache evicting the code at the end of its TTL.
+        cache.delete('otp:student@example.com')
+
+        self.assertEqual(self.store.verify('student@example.com', code), otp.EXPIRED)
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password', first_name='Ada')
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        user, _token = ClaimsJWTAuthentication().authenticate(request)
+        return user
+
+    def test_user_is_built_from_claims_without_a_query(self):
+        token = ClaimsRefreshToken.for_user(self.user).access_token
+
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+            self.assertIsInstance(user, ClaimsUser)
+            self.assertEqual((user.pk, user.email, user.is_staff),
+                             (self.user.pk, 'student@example.com', False))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.first_name, 'Ada')
+            self.assertIsNotNone(user.date_joined)
+
+    def test_save_does_not_write_back_stale_claims(self):
+        user = self.authenticate(ClaimsRefreshToken.for_user(self.user).access_token)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True)
+
+        user.first_name = 'Grace'
+        user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.is_staff), ('Grace', True))
+
+    def test_refresh_reissues_current_claims(self):
+        refresh = ClaimsRefreshToken.for_user(self.user)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True)
+
+        serializer = ClaimsTokenRefreshSerializer(data={'refresh': str(refresh)})
+        serializer.is_valid(raise_exception=True)
+
+        self.assertTrue(AccessToken(serializer.validated_data['access'])['is_staff'])
+
+    def test_tokens_without_claims_load_the_user(self):
+        token = RefreshToken.for_user(self.user).access_token
+
+        with self.assertNumQueries(1):
+            user = self.authenticate(token)
+
+        self.assertEqual(type(user), CustomUser)
+
+
+def make_signing_key(kid):
+    private_pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption())
+    public_jwk = jwk.construct(private_pem, 'RS256').public_key().to_dict()
+    return private_pem, {**public_jwk, 'kid': kid}
+
+
+class StubJWKSHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.fetches += 1
+        body = json.dumps({'keys': self.server.keys}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class OktaAuthenticationTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubJWKSHandler)
+        self.server.fetches = 0
+        self.private_pem, public_jwk = make_signing_key('key-1')
+        self.server.keys = [public_jwk]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        okta_settings = override_settings(
+            OKTA_JWKS_URL=f'http://127.0.0.1:{self.server.server_port}/v1/keys',
+            OKTA_ISSUER='https://okta.example.com', OKTA_AUDIENCE='api://default',
+            OKTA_JWKS_MIN_REFRESH=0)
+        okta_settings.enable()
+        self.addCleanup(okta_settings.disable)
+        middleware.get_jwks_cache.cache_clear()
+        middleware.get_claims_cache.cache_clear()
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password')
+
+    def make_token(self, private_pem=None, kid='key-1', **claims):
+        claims = {'sub': 'student@example.com', 'iss': 'https://okta.example.com',
+                  'aud': 'api://default', 'exp': int(time.time()) + 300, **claims}
+        return jwt.encode(claims, private_pem or self.private_pem,
+                          algorithm='RS256', headers={'kid': kid})
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return middleware.OktaAuthentication().authenticate(request)
+
+    def test_repeat_requests_use_cached_keys_claims_and_user(self):
+        token = self.make_token()
+        user, _token = self.authenticate(token)
+        self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(0):
+            self.authenticate(token)
+        self.authenticate(self.make_token(scope='other'))
+        self.assertEqual(self.server.fetches, 1)
+
+    def test_rotated_key_is_fetched_on_unknown_kid(self):
+        self.authenticate(self.make_token())
+        private_pem, public_jwk = make_signing_key('key-2')
+        self.server.keys.append(public_jwk)
+
+        user, _token = self.authenticate(self.make_token(private_pem, kid='key-2'))
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(self.server.fetches, 2)
+
+    def test_invalid_tokens_are_rejected(self):
+        forged_pem, _public_jwk = make_signing_key('key-1')
+        for token in [self.make_token(forged_pem), self.make_token(kid='unknown'),
+                      self.make_token(exp=int(time.time()) - 1),
+                      self.make_token(aud='api://other')]:
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+
+    def test_saving_the_user_drops_the_cached_user(self):
+        token = self.make_token()
+        self.authenticate(token)
+
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.user.refresh_from_db()
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_changing_the_user_field_drops_the_old_key(self):
+        token = self.make_token()
+        self.authenticate(token)
+
+        self.user.email = 'renamed@example.com'
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+        user, _token = self.authenticate(self.make_token(sub='renamed@example.com'))
+        self.assertEqual(user, self.user)
+
+    def test_deleting_a_claims_user_drops_the_cached_user(self):
+        token = self.make_token()
+        self.authenticate(token)
+
+        ClaimsUser.objects.get(pk=self.user.pk).delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+
+@override_settings(THROTTLE_REDIS_URL=None)
+@mock.patch.object(throttling.SlidingWindowThrottle, 'THROTTLE_RATES',
+                   {'login_ip': '4/min', 'login_email': '2/min'})
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        throttling.get_sliding_window.cache_clear()
+        self.url = reverse('token_obtain_pair')
+
+    def login(self, email):
+        return self.client.post(self.url, {'email': email, 'password': 'wrong'})
+
+    def test_email_is_throttled_before_authentication(self):
+        for _ in range(2):
+            self.assertEqual(self.login('Student@example.com').status_code, 400)
+
+        with mock.patch('rest_framework_simplejwt.serializers.authenticate') as authenticate:
+            response = self.login('student@example.com')
+
+        self.assertEqual(response.status_code, 429)
+        authenticate.assert_not_called()
+        self.assertEqual(self.login('other@example.com').status_code, 400)
+
+    def test_ip_is_throttled_across_emails(self):
+        for index in range(4):
+            self.assertEqual(self.login(f'user{index}@example.com').status_code, 400)
+
+        self.assertEqual(self.login('user5@example.com').status_code, 429)
+
+    def test_ip_throttle_ignores_forwarded_for(self):
+        for index in range(4):
+            response = self.client.post(
+                self.url, {'email': f'user{index}@example.com', 'password': 'wrong'},
+                headers={'X-Forwarded-For': f'10.0.0.{index}'})
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            self.url, {'email': 'user5@example.com', 'password': 'wrong'},
+            headers={'X-Forwarded-For': '10.0.0.5'})
+        self.assertEqual(response.status_code, 429)
+
+
+class BloomFilterTests(TestCase):
+    def test_added_items_are_always_found(self):
+        bloom = blacklist.BloomFilter(capacity=1000, error_rate=0.01)
+        jtis = [f'jti-{index}' for index in range(1000)]
+        for jti in jtis:
+            bloom.add(jti)
+
+        self.assertTrue(all(jti in bloom for jti in jtis))
+        false_positives = sum(f'other-{index}' in bloom for index in range(1000))
+        self.assertLess(false_positives, 50)
+
+
+@override_settings(BLACKLIST_REDIS_URL='redis://blacklist', BLACKLIST_PUBLISH_BACKOFF=0)
+class BlacklistStreamTests(TestCase):
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.server)
+        patcher = mock.patch.object(
+            blacklist.redis.Redis, 'from_url',
+            lambda *args, **kwargs: fakeredis.FakeRedis(server=self.server))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        blacklist.get_blacklist_filter.cache_clear()
+        self.addCleanup(blacklist.get_blacklist_filter.cache_clear)
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password')
+
+    def blacklist_token(self, publish=True):
+        refresh = ClaimsRefreshToken.for_user(self.user)
+        with self.captureOnCommitCallbacks(execute=publish):
+            refresh.blacklist()
+        return refresh['jti']
+
+    def make_reader(self):
+        # Another process's filter, built from the current table and stream.
+        reader = blacklist.BlacklistFilter()
+        reader.might_contain('warm-up')
+        return reader
+
+    def test_other_processes_read_new_jtis_from_the_stream(self):
+        reader = self.make_reader()
+
+        jti = self.blacklist_token()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(reader.might_contain(jti))
+
+    def test_trimmed_stream_triggers_a_rebuild(self):
+        self.blacklist_token()
+        reader = self.make_reader()
+        missed = [self.blacklist_token() for _ in range(2)]
+        self.redis.xtrim(blacklist.BLACKLIST_STREAM, maxlen=1, approximate=False)
+        unpublished = self.blacklist_token(publish=False)
+
+        self.assertTrue(all(reader.might_contain(jti) for jti in missed + [unpublished]))
+
+    def test_filter_is_rebuilt_after_the_interval(self):
+        reader = self.make_reader()
+        jti = self.blacklist_token(publish=False)
+
+        self.assertFalse(reader.might_contain(jti))
+        with override_settings(BLACKLIST_FILTER_REBUILD_INTERVAL=0):
+            self.assertTrue(reader.might_contain(jti))
+
+    def test_failed_publish_is_retried_before_the_next_check(self):
+        reader = self.make_reader()
+        self.server.connected = False
+        with self.assertLogs('authentication.blacklist', 'ERROR'):
+            jti = self.blacklist_token()
+        self.server.connected = True
+        self.assertFalse(reader.might_contain(jti))
+
+        blacklist.might_be_blacklisted('other')
+
+        self.assertTrue(reader.might_contain(jti))
+
+
+@override_settings(BLACKLIST_REDIS_URL=None)
+class RefreshTokenBlacklistTests(TestCase):
+    def setUp(self):
+        blacklist.get_blacklist_filter.cache_clear()
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password', first_name='Ada')
+
+    def test_blacklisted_token_is_rejected_without_redis(self):
+        refresh = ClaimsRefreshToken.for_user(self.user)
+        refresh.blacklist()
+
+        with self.assertRaises(TokenError):
+            ClaimsRefreshToken(str(refresh))
+
+    def test_prune_tokens_deletes_only_expired_tokens(self):
+        refresh = ClaimsRefreshToken.for_user(self.user)
+        expired = ClaimsRefreshToken.for_user(self.user)
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(
+            expires_at=timezone.now() - timezone.timedelta(days=1))
+
+        call_command('prune_tokens', batch_size=1, stdout=io.StringIO())
+
+        self.assertQuerySetEqual(OutstandingToken.objects.values_list('jti', flat=True),
+                                 [refresh['jti']])
+        self.assertFalse(BlacklistedToken.objects.exists())
@@ -1,7 +1,6 @@
 # views.py
 import os
 import logging
-import random
 from rest_framework.generics import DestroyAPIView
 from django.shortcuts import get_object_or_404
 from authentication.models import CustomUser
@@ -9,9 +8,9 @@ from exceptions.custom_apiexception_class import *
 from utils.custom_response import custom_response
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_protect
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 from dotenv import load_dotenv
+from mailer.outbox import queue_email
+from mailer.rendering import render_email
 from rest_framework import generics
 from rest_framework import status
 from rest_framework.response import Response
@@ -20,10 +19,12 @@ from drf_yasg import openapi
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from django.contrib.auth import get_user_model
+from . import otp
 from .serializers import ChangePasswordSerializer, UserSerializer, TokenObtainPairResponseSerializer, TokenRefreshResponseSerializer, TokenVerifyResponseSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
 from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.tokens import RefreshToken
+from .throttling import EmailSlidingWindowThrottle, IPSlidingWindowThrottle
+from .tokens import ClaimsRefreshToken
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -32,6 +33,8 @@ User = get_user_model()
 
 class RegisterView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [IPSlidingWindowThrottle, EmailSlidingWindowThrottle]
+    throttle_scope = 'register'
 
     @swagger_auto_schema(
         request_body=UserSerializer,
@@ -41,7 +44,7 @@ class RegisterView(APIView):
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             response_data = {
                 'user': serializer.data,
                 'refresh': str(refresh),
@@ -56,6 +59,9 @@ class RegisterView(APIView):
 
 
 class LoginView(TokenObtainPairView):
+    throttle_classes = [IPSlidingWindowThrottle, EmailSlidingWindowThrottle]
+    throttle_scope = 'login'
+
     @swagger_auto_schema(
         responses={
             status.HTTP_200_OK: TokenObtainPairResponseSerializer,
@@ -194,7 +200,7 @@ class Logout(APIView):
             refresh_token = request.data['refresh']
             logger.debug(f"Refresh token received: {refresh_token}")
 
-            token = RefreshToken(refresh_token)
+            token = ClaimsRefreshToken(refresh_token)
             token.blacklist()
 
             logger.info(
@@ -277,32 +283,32 @@ class DeleteAccount(APIView):
         logger.info(f"User instance deleted: {instance.email}")
 
 
-otp_storage = {}
-
-
 class EmailOTPAuthentication(APIView):
+    throttle_classes = [IPSlidingWindowThrottle, EmailSlidingWindowThrottle]
+    throttle_scope = 'otp'
+    otp_messages = {
+        otp.INVALID: "Incorrect OTP.",
+        otp.EXPIRED: "OTP not sent for this email or it has expired.",
+        otp.LOCKED: "Too many incorrect attempts. Request a new OTP.",
+    }
+
     def post(self, request):
         email = request.data.get('email')
 
-        otp = ''.join([str(random.randint(0, 9)) for _ in range(6)])
-
         # Store the OTP with the email as the key
-        otp_storage[email] = otp
+        code = otp.get_otp_store().issue(email)
 
         merge_data = {
-            'inshopper_user': request.user.email,
-            'otp': otp,
+            'titanium_training_user': request.user.email,
+            'otp': code,
         }
-        html_body = render_to_string(
-            "emails/otp_mail.html", merge_data)
-        msg = EmailMultiAlternatives(
+        html_body = render_email("emails/otp_mail.html", merge_data)
+        queue_email(
             subject="Email Verification OTP.",
             from_email=os.getenv('EMAIL_USER'),
             to=[request.user.email],
-            body=" ",
+            html_body=html_body,
         )
-        msg.attach_alternative(html_body, "text/html")
-        msg.send(fail_silently=False)
 
         return custom_response(status_code=status.HTTP_200_OK, message="OTP sent to your email.", data=None)
 
@@ -310,11 +316,7 @@ class EmailOTPAuthentication(APIView):
         email = request.data.get('email')
         otp_entered = request.data.get('otp')
 
-        if email not in otp_storage:
-            return CustomAPIException(detail="OTP not sent for this email.", status_code=status.HTTP_400_BAD_REQUEST).get_full_details()
-
-        if otp_entered == otp_storage[email]:
-            del otp_storage[email]
+        result = otp.get_otp_store().verify(email, otp_entered)
+        if result == otp.VERIFIED:
             return custom_response(status_code=status.HTTP_200_OK, message="Email verification successful.", data=None)
-        else:
-            return CustomAPIException(detail="Incorrect OTP.", status_code=status.HTTP_400_BAD_REQUEST).get_full_details()
+        return CustomAPIException(detail=self.otp_messages[result], status_code=status.HTTP_400_BAD_REQUEST).get_full_details()
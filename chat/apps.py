@@ -1,6 +1,13 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class ChatConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chat"
+
+    def ready(self):
+        from .buffer import write_buffer
+
+        atexit.register(write_buffer.flush_on_exit)
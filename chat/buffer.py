@@ -0,0 +1,96 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBuffer:
+    """
+    Per-process buffer that persists chat messages in batches.
+
+    Pending messages are written with a single ``bulk_create`` once
+    ``CHAT_WRITE_BATCH_SIZE`` of them are queued, or
+    ``CHAT_WRITE_FLUSH_INTERVAL_MS`` after the first one arrived, whichever
+    comes first, so a busy room costs one INSERT per batch rather than one
+    per message. Messages carry their id and timestamp from the moment they
+    were received, so the order seen live matches the stored history.
+
+    Messages are broadcast before they are written, so a failed batch is
+    put back at the front of the queue and retried with backoff, up to
+    ``CHAT_WRITE_MAX_ATTEMPTS`` times. Consumers flush when they disconnect,
+    and whatever is still pending is written when the process exits.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.timer = None
+        self.tasks = set()
+        self.failures = 0
+
+    @property
+    def batch_size(self):
+        return settings.CHAT_WRITE_BATCH_SIZE
+
+    @property
+    def flush_interval(self):
+        return settings.CHAT_WRITE_FLUSH_INTERVAL_MS / 1000
+
+    async def add(self, message):
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        else:
+            self.schedule(self.flush_interval)
+
+    def schedule(self, delay):
+        if self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(
+                delay, self._flush_later)
+
+    def _flush_later(self):
+        self.timer = None
+        # Keep a reference so the task is not garbage collected mid-flight.
+        task = asyncio.ensure_future(self.flush())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            await database_sync_to_async(ChatMessage.objects.bulk_create)(batch)
+        except Exception:
+            self.failures += 1
+            if self.failures >= settings.CHAT_WRITE_MAX_ATTEMPTS:
+                logger.exception("Dropping %s chat messages after %s failed writes",
+                                 len(batch), self.failures)
+                self.failures = 0
+                return
+            logger.exception("Failed to persist %s chat messages, retrying", len(batch))
+            # Ahead of anything queued meanwhile, to keep the stored order.
+            self.pending[:0] = batch
+            self.schedule(self.flush_interval * 2 ** self.failures)
+            return
+        self.failures = 0
+
+    def flush_on_exit(self):
+        """Write pending messages synchronously; registered with atexit."""
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            ChatMessage.objects.bulk_create(batch)
+        except Exception:
+            logger.exception("Failed to persist %s chat messages on exit", len(batch))
+
+
+write_buffer = MessageWriteBuffer()
@@ -1,40 +1,246 @@
-import json
+import asyncio
+import logging
+import time
+import uuid
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from . import presence
+from .buffer import write_buffer
+from .framing import (MSGPACK_SUBPROTOCOL, decode_frame, encode_event, join_json,
+                      join_msgpack, select_subprotocol)
+from .models import ChatMessage, ChatRoom
+from .permissions import can_join_room
+from .ratelimit import get_connection_bucket, get_room_bucket
+
+logger = logging.getLogger(__name__)
+
+# Application close codes (4000-4999 are reserved for applications).
+CLOSE_UNAUTHORIZED = 4001
+CLOSE_FORBIDDEN = 4003
+CLOSE_NOT_FOUND = 4004
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Course room chat.
+
+    Clients send JSON frames with a ``type`` of ``message`` (the default),
+    ``typing``, ``read`` or ``heartbeat``. Messages are persisted and fanned
+    out; typing indicators and read receipts are only fanned out. Presence
+    is kept in Redis and refreshed by heartbeats, which clients should send
+    well within ``CHAT_PRESENCE_TTL``.
+
+    Every group event is serialized once by its sender. Clients that
+    negotiate one of the ``framing.SUBPROTOCOLS`` receive events coalesced
+    over ``CHAT_COALESCE_WINDOW_MS`` into a single JSON or msgpack array
+    frame, and may send msgpack binary frames themselves. Malformed client
+    frames are answered with an error frame.
+    """
+
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = f'chat_{self.room_name}'
+        self.user = self.scope.get('user')
+        self.joined = False
+        self.subprotocol = select_subprotocol(
+            self.scope.get('subprotocols', []))
+        self.outbox = []
+        self.outbox_flush = None
+
+        if self.user is None or not self.user.is_authenticated:
+            await self.reject(CLOSE_UNAUTHORIZED)
+            return
+        room = await self.get_room()
+        if room is None:
+            await self.reject(CLOSE_NOT_FOUND)
+            return
+        if not await database_sync_to_async(can_join_room)(self.user, room):
+            await self.reject(CLOSE_FORBIDDEN)
+            return
+        self.room_id = room.pk
+        self.user_id = str(self.user.pk)
+
+        # Check the connection's own bucket before the room's so an abusive
+        # sender cannot use up the room's budget with messages that are
+        # dropped anyway.
+        self.connection_bucket = get_connection_bucket()
+        self.room_bucket = get_room_bucket(self.room_id)
+        self.throttled = False
+        self.last_typing = 0
 
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        self.joined = True
+
+        await self.accept(self.subprotocol)
 
+        if await self.update_presence(presence.heartbeat(
+                self.room_id, self.user_id, self.channel_name)):
+            await self.send_presence(online=True)
+
+    async def reject(self, code):
+        # Accept first so the client sees why it was turned away; a close
+        # during the handshake always surfaces as a generic 403.
         await self.accept()
+        await self.close(code=code)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if self.outbox_flush is not None:
+            self.outbox_flush.cancel()
+        if self.joined:
+            # Don't leave this connection's messages waiting on the timer;
+            # the worker may be shutting down.
+            await write_buffer.flush()
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
+            # Other tabs may keep the user online.
+            if await self.update_presence(presence.leave(
+                    self.room_id, self.user_id, self.channel_name)) is False:
+                await self.send_presence(online=False)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # A rejected socket is accepted before it is closed, so frames can
+        # still arrive on it.
+        if not self.joined:
+            return
+        if not self.connection_bucket.consume():
+            await self.notify_throttled()
+            return
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
+        content = decode_frame(text_data, bytes_data)
+        if not isinstance(content, dict):
+            await self.send_error('Malformed frame, expected a JSON or msgpack object.')
+            return
+        frame_type = content.get('type', 'message')
+        if frame_type == 'message':
+            await self.receive_message(content)
+        elif frame_type == 'typing':
+            await self.receive_typing()
+        elif frame_type == 'read':
+            await self.receive_read(content)
+        elif frame_type == 'heartbeat':
+            await self.update_presence(presence.heartbeat(
+                self.room_id, self.user_id, self.channel_name))
 
+    async def receive_message(self, content):
+        if not self.room_bucket.consume():
+            await self.notify_throttled()
+            return
+        self.throttled = False
+
+        message = content.get('message')
+        if not isinstance(message, str) or not message.strip():
+            return
+
+        chat_message = ChatMessage(
+            room_id=self.room_id, user_id=self.user.pk, content=message)
+        await write_buffer.add(chat_message)
+        await self.update_presence(presence.record_message(
+            self.room_id, chat_message.id))
+
+        await self.broadcast({
+            'type': 'message',
+            'id': str(chat_message.id),
+            'user': self.user_id,
+            'message': message,
+            'timestamp': chat_message.timestamp.isoformat(),
+        })
+
+    async def receive_typing(self):
+        now = time.monotonic()
+        if now - self.last_typing < settings.CHAT_TYPING_INTERVAL:
+            return
+        self.last_typing = now
+        await self.broadcast({'type': 'typing', 'user': self.user_id},
+                             skip_user=self.user_id)
+
+    async def receive_read(self, content):
+        try:
+            message_id = uuid.UUID(str(content.get('message')))
+        except ValueError:
+            return
+        if not await self.update_presence(presence.mark_read(
+                self.room_id, self.user_id, message_id)):
+            return
+        await self.broadcast(
+            {'type': 'read', 'user': self.user_id, 'message': str(message_id)})
+
+    async def notify_throttled(self):
+        # Tell the client once per burst rather than once per message.
+        if not self.throttled:
+            self.throttled = True
+            await self.send_error('Rate limit exceeded, message dropped.')
+
+    async def send_error(self, error):
+        await self.send_event(encode_event({'type': 'error', 'error': error}))
+
+    async def update_presence(self, update):
+        """
+        Await a Redis presence update. Presence is best effort: if Redis is
+        unavailable chat keeps working and ``None`` is returned.
+        """
+        try:
+            return await update
+        except RedisError:
+            logger.warning("Chat presence update failed", exc_info=True)
+            return None
+
+    async def send_presence(self, online):
+        await self.broadcast(
+            {'type': 'presence', 'user': self.user_id, 'online': online})
+
+    async def broadcast(self, payload, skip_user=None):
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message
-            }
+            dict(encode_event(payload), type='chat_event', skip_user=skip_user)
         )
 
-    async def chat_message(self, event):
-        message = event['message']
+    async def chat_event(self, event):
+        if event['skip_user'] is not None and event['skip_user'] == self.user_id:
+            return
+        await self.send_event(event)
+
+    async def send_event(self, event):
+        if self.subprotocol is None:
+            await self.send(text_data=event['text'])
+            return
+
+        self.outbox.append(
+            event['bytes'] if self.subprotocol == MSGPACK_SUBPROTOCOL else event['text'])
+        if len(self.outbox) >= settings.CHAT_COALESCE_MAX_EVENTS:
+            await self.flush_outbox()
+        elif self.outbox_flush is None:
+            self.outbox_flush = asyncio.ensure_future(self.flush_outbox_later())
+
+    async def flush_outbox_later(self):
+        await asyncio.sleep(settings.CHAT_COALESCE_WINDOW_MS / 1000)
+        self.outbox_flush = None
+        await self.flush_outbox()
+
+    async def flush_outbox(self):
+        if self.outbox_flush is not None:
+            self.outbox_flush.cancel()
+            self.outbox_flush = None
+        events, self.outbox = self.outbox, []
+        if not events:
+            return
+        if self.subprotocol == MSGPACK_SUBPROTOCOL:
+            await self.send(bytes_data=join_msgpack(events))
+        else:
+            await self.send(text_data=join_json(events))
 
-        await self.send(text_data=json.dumps({
-            'message': message
-        }))
+    @database_sync_to_async
+    def get_room(self):
+        try:
+            room_id = uuid.UUID(self.room_name)
+        except ValueError:
+            return None
+        return ChatRoom.objects.select_related('course').filter(pk=room_id).first()
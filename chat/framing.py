@@ -0,0 +1,57 @@
+import json
+import struct
+
+import msgpack
+
+# Opt-in WebSocket subprotocols. Both deliver coalesced batches: a JSON
+# array per text frame, or a msgpack array per binary frame. Clients that
+# ask for neither get one JSON object per text frame, as before.
+JSON_SUBPROTOCOL = 'chat.json'
+MSGPACK_SUBPROTOCOL = 'chat.msgpack'
+SUBPROTOCOLS = (MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL)
+
+
+def select_subprotocol(requested):
+    for subprotocol in requested:
+        if subprotocol in SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+
+def encode_event(payload):
+    """
+    Serialize a frame payload once for every framing, so recipients only
+    copy bytes instead of each encoding the same event again.
+    """
+    return {
+        'text': json.dumps(payload, separators=(',', ':')),
+        'bytes': msgpack.packb(payload),
+    }
+
+
+def msgpack_array_header(length):
+    if length < 16:
+        return bytes([0x90 | length])
+    if length < 0x10000:
+        return b'\xdc' + struct.pack('>H', length)
+    return b'\xdd' + struct.pack('>I', length)
+
+
+def join_json(texts):
+    return '[' + ','.join(texts) + ']'
+
+
+def join_msgpack(items):
+    # Items are already msgpack encoded, so a batch is just an array header
+    # followed by the items as they are.
+    return msgpack_array_header(len(items)) + b''.join(items)
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    """Decode a client frame, returning None if it is not valid JSON or msgpack."""
+    try:
+        if bytes_data is not None:
+            return msgpack.unpackb(bytes_data)
+        return json.loads(text_data)
+    except (ValueError, TypeError, msgpack.UnpackException):
+        return None
@@ -0,0 +1,97 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+
+from channels_redis.core import RedisChannelLayer
+
+# Points per host on the hash ring; more points spread keys more evenly.
+RING_REPLICAS = 160
+
+logger = logging.getLogger(__name__)
+
+
+def ring_hash(value):
+    if isinstance(value, str):
+        value = value.encode('utf8')
+    return int.from_bytes(hashlib.md5(value).digest()[:4], 'big')
+
+
+class ShardedChannelLayer(RedisChannelLayer):
+    """
+    Redis channel layer sharded over several hosts with a consistent hash
+    ring, which also delivers group messages to channels of this process
+    directly.
+
+    channels_redis splits its hash space into equal ranges per host, so
+    adding a host moves most groups to a different shard. On the ring a new
+    host only takes over about 1/n of them. Points are derived from each
+    host's address, so the order of ``CHANNEL_REDIS_HOSTS`` does not matter.
+
+    ``group_send`` still reads the group's members from Redis, but members
+    that live on this worker have the message put straight into their
+    receive buffer instead of making a round trip through Redis and back.
+    Local members receive the message dict without the msgpack round trip.
+    They are held to the same per-channel capacity as the Redis path: a
+    full channel drops the new message, as ``group_send`` does. If the
+    receiver blocked on this process's Redis inbox was among them, an empty
+    message is queued there in the same batch to wake it up.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        points = []
+        for index, host in enumerate(self.hosts):
+            address = host.get('address') or f"{host.get('host')}:{host.get('port')}"
+            points.extend((ring_hash(f'{address}-{replica}'), index)
+                          for replica in range(RING_REPLICAS))
+        points.sort()
+        self.ring_points = [point for point, _index in points]
+        self.ring_indexes = [index for _point, index in points]
+
+    def consistent_hash(self, value):
+        if self.ring_size == 1:
+            return 0
+        position = bisect.bisect(self.ring_points, ring_hash(value))
+        return self.ring_indexes[position % len(self.ring_points)]
+
+    def is_local_channel(self, channel):
+        return '!' in channel and self.non_local_name(channel).endswith(self.client_prefix + '!')
+
+    def _map_channel_keys_to_connection(self, channel_names, message):
+        # Only short-circuit when called on the loop that is receiving for
+        # this process; the receive buffers are not thread safe.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        inboxes = set()
+        if loop is not None and loop is self.receive_event_loop:
+            remote = []
+            over_capacity = 0
+            for channel in channel_names:
+                if not self.is_local_channel(channel):
+                    remote.append(channel)
+                elif self.receive_buffer[channel].qsize() < self.get_capacity(channel):
+                    self.receive_buffer[channel].put_nowait(dict(message))
+                    inboxes.add(self.non_local_name(channel))
+                else:
+                    over_capacity += 1
+            if over_capacity:
+                logger.info(f"{over_capacity} of {len(channel_names)} local channels over capacity")
+            channel_names = remote
+        mapping = super()._map_channel_keys_to_connection(channel_names, message)
+        if inboxes and self.receive_lock is not None and self.receive_lock.locked():
+            self.add_wake_ups(inboxes, *mapping)
+        return mapping
+
+    def add_wake_ups(self, inboxes, connection_to_channel_keys, channel_key_to_message,
+                     channel_key_to_capacity):
+        # The receiver holding the lock is blocked on this process's inbox
+        # in Redis, not on its buffer. Queue an empty message there so it
+        # wakes up and finds what was delivered locally.
+        for inbox in inboxes:
+            channel_key = self.prefix + inbox
+            channel_key_to_message[channel_key] = self.serialize({'__asgi_channel__': []})
+            channel_key_to_capacity[channel_key] = self.get_capacity(inbox)
+            connection_to_channel_keys[self.consistent_hash(inbox)].append(channel_key)
@@ -0,0 +1,58 @@
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.framing import encode_event, join_json, join_msgpack
+
+
+class Command(BaseCommand):
+    help = "Compare the CPU cost per delivered chat message of the WebSocket framings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=300)
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--batch', type=int, default=20,
+                            help="Events coalesced into one frame.")
+
+    def handle(self, *args, **options):
+        recipients = options['recipients']
+        messages = options['messages']
+        batch = options['batch']
+        payloads = [{
+            'type': 'message',
+            'id': str(uuid.uuid4()),
+            'user': str(uuid.uuid4()),
+            'message': f"Message {index} about this week's assignment.",
+            'timestamp': timezone.now().isoformat(),
+        } for index in range(messages)]
+
+        def per_recipient_json():
+            # The original path: every recipient encodes every event.
+            for payload in payloads:
+                for _recipient in range(recipients):
+                    json.dumps(payload)
+
+        def coalesced(join, key):
+            events = [encode_event(payload)[key] for payload in payloads]
+            for start in range(0, messages, batch):
+                items = events[start:start + batch]
+                for _recipient in range(recipients):
+                    join(items)
+
+        results = [
+            ('json, per recipient', per_recipient_json),
+            ('json, encoded once, coalesced',
+             lambda: coalesced(join_json, 'text')),
+            ('msgpack, encoded once, coalesced',
+             lambda: coalesced(join_msgpack, 'bytes')),
+        ]
+        delivered = messages * recipients
+        for name, run in results:
+            started = time.process_time()
+            run()
+            elapsed = time.process_time() - started
+            self.stdout.write(
+                f"{name:<36} {elapsed * 1e6 / delivered:8.3f} us CPU per delivered message")
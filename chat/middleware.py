@@ -0,0 +1,57 @@
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+
+from authentication.tokens import ClaimsJWTAuthentication
+
+
+def get_scope_token(scope):
+    """
+    Return the raw access token for a WebSocket handshake, if any.
+
+    Browsers cannot set headers on a WebSocket handshake, so the ``token``
+    query parameter is checked first, then an ``Authorization: Bearer``
+    header for other clients.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    if query.get('token'):
+        return query['token'][0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0].lower() == 'bearer':
+                return parts[1]
+    return None
+
+
+@database_sync_to_async
+def get_jwt_user(token):
+    authentication = ClaimsJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token))
+    except AuthenticationFailed:
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticate WebSocket connections with a simplejwt access token.
+
+    The user is resolved once, when the connection is opened, and kept in
+    ``scope['user']`` for the lifetime of the socket. Connections without a
+    token keep whatever user the session middleware put in the scope.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = get_scope_token(scope)
+        if token is not None:
+            scope = dict(scope, user=await get_jwt_user(token))
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0002_message_timestamp_default"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="chatmessage",
+            options={"ordering": ("timestamp", "id")},
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["room", "timestamp", "id"], name="chatmessage_room_ts_id_idx"
+            ),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import uuid
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from course.models import Course
 
@@ -25,7 +26,14 @@ class ChatMessage(models.Model):
     user = models.ForeignKey(
         User, related_name='messages', on_delete=models.CASCADE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the message is received rather than when its batch is
+    # written, so buffered inserts keep the live ordering.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
-        ordering = ('timestamp',)
+        ordering = ('timestamp', 'id')
+        indexes = [
+            # Room history is read as (timestamp, id) windows per room.
+            models.Index(fields=['room', 'timestamp', 'id'],
+                         name='chatmessage_room_ts_id_idx'),
+        ]
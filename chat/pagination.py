@@ -0,0 +1,65 @@
+from django.db.models import Q
+from rest_framework import status
+
+from utils.custom_pagination import CursorPagination
+from utils.custom_response import custom_response
+
+
+class ChatMessagePagination(CursorPagination):
+    """
+    Chat history windows over ``(timestamp, id)``, oldest first within a page.
+
+    Without a cursor the latest ``page_size`` messages are returned.
+    ``before=<cursor>`` scrolls back to older messages and ``after=<cursor>``
+    fetches anything newer, e.g. to catch up after a reconnect. ``has_more``
+    says whether further messages exist in the direction being read. Every
+    window is a single seek on the ``(room, timestamp, id)`` index.
+    """
+    ordering_field = 'timestamp'
+    before_query_param = 'before'
+    after_query_param = 'after'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        before = self.decode_cursor(
+            request, query_param=self.before_query_param)
+        after = self.decode_cursor(request, query_param=self.after_query_param)
+
+        if after is not None:
+            timestamp, pk, _ = after
+            queryset = queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+            ).order_by('timestamp', 'id')
+        else:
+            if before is not None:
+                timestamp, pk, _ = before
+                queryset = queryset.filter(
+                    Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+            queryset = queryset.order_by('-timestamp', '-id')
+
+        # One extra row tells us whether more messages exist without a COUNT.
+        results = list(queryset[:page_size + 1])
+        self.has_more = len(results) > page_size
+        results = results[:page_size]
+        if after is None:
+            results.reverse()
+
+        self.before_cursor = None
+        self.after_cursor = request.query_params.get(self.after_query_param)
+        if results:
+            if after is not None or self.has_more:
+                self.before_cursor = self.encode_cursor(results[0])
+            # Always hand back an "after" cursor so clients can poll for
+            # messages newer than the ones they already hold.
+            self.after_cursor = self.encode_cursor(results[-1])
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data, message="Success"):
+        return custom_response(status_code=status.HTTP_200_OK, message=message, data={
+            'before': self.before_cursor,
+            'after': self.after_cursor,
+            'has_more': self.has_more,
+            'results': data
+        })
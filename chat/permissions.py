@@ -0,0 +1,51 @@
+import uuid
+
+from rest_framework.permissions import BasePermission
+
+from subscription.entitlements import has_active_subscription
+
+from .models import ChatRoom
+
+
+def can_join_room(user, room):
+    """
+    A course room is open to the course's author, staff, and users holding
+    an active subscription.
+    """
+    if not user.is_authenticated:
+        return False
+    if user.is_staff or room.course.user_id == user.pk:
+        return True
+    return has_active_subscription(user)
+
+
+def get_joinable_rooms(user):
+    """The rooms ``user`` may join, as a queryset matching can_join_room."""
+    rooms = ChatRoom.objects.all()
+    if user.is_staff or has_active_subscription(user):
+        return rooms
+    return rooms.filter(course__user=user)
+
+
+class IsRoomMember(BasePermission):
+    """
+    Checks the room in the ``room_id`` URL kwarg on nested routes such as
+    messages, and the room object itself on the room routes.
+    """
+    message = 'You are not a member of this room.'
+
+    def has_permission(self, request, view):
+        if 'room_id' not in view.kwargs:
+            return True
+        try:
+            room_id = uuid.UUID(str(view.kwargs['room_id']))
+        except ValueError:
+            return False
+        room = ChatRoom.objects.select_related(
+            'course').filter(pk=room_id).first()
+        return room is not None and can_join_room(request.user, room)
+
+    def has_object_permission(self, request, view, obj):
+        if isinstance(obj, ChatRoom):
+            return can_join_room(request.user, obj)
+        return True
@@ -0,0 +1,170 @@
+import asyncio
+import time
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+# Redis keys, per room:
+#   chat:presence:<room>  sorted set of "<user>:<channel>" scored by last heartbeat
+#   chat:messages:<room>  number of messages ever posted to the room,
+#                         counted when a message is accepted
+#   chat:sequence:<room>:<message>  the message's position in that count,
+#                         kept for CHAT_READ_SEQUENCE_TTL seconds
+#   chat:read:<room>      hash of user -> position of the last message read
+#   chat:read_message:<room>  hash of user -> id of the last message they read
+# Unread counts are messages minus the reader's marker: two O(1) lookups
+# instead of a COUNT over ChatMessage.
+
+_async_clients = weakref.WeakKeyDictionary()
+_sync_client = None
+
+
+def get_redis():
+    # asyncio clients are bound to the loop that created them.
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = redis.asyncio.Redis.from_url(
+            settings.CHAT_REDIS_URL)
+    return client
+
+
+def get_sync_redis():
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(settings.CHAT_REDIS_URL)
+    return _sync_client
+
+
+def presence_key(room_id):
+    return f'chat:presence:{room_id}'
+
+
+def message_count_key(room_id):
+    return f'chat:messages:{room_id}'
+
+
+def message_sequence_key(room_id, message_id):
+    return f'chat:sequence:{room_id}:{message_id}'
+
+
+def read_count_key(room_id):
+    return f'chat:read:{room_id}'
+
+
+def read_message_key(room_id):
+    return f'chat:read_message:{room_id}'
+
+
+def connection_member(user_id, channel_name):
+    return f'{user_id}:{channel_name}'
+
+
+# KEYS: message count, message sequence. ARGV: sequence TTL.
+RECORD_MESSAGE_SCRIPT = """
+local sequence = redis.call('INCR', KEYS[1])
+redis.call('SET', KEYS[2], sequence, 'EX', ARGV[1])
+return sequence
+"""
+
+# KEYS: message sequence, read counts, read messages. ARGV: user, message.
+# Markers only move forward, so a late receipt for an older message does
+# not mark newer ones unread again.
+MARK_READ_SCRIPT = """
+local sequence = tonumber(redis.call('GET', KEYS[1]))
+if not sequence then
+    return 0
+end
+local current = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+if sequence > current then
+    redis.call('HSET', KEYS[2], ARGV[1], sequence)
+    redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+end
+return sequence
+"""
+
+
+async def heartbeat(room_id, user_id, channel_name):
+    """
+    Mark a connection as present and return True. Connections that miss
+    heartbeats for ``CHAT_PRESENCE_TTL`` seconds are treated as gone, which
+    also covers workers that die without running ``disconnect``.
+    """
+    key = presence_key(room_id)
+    now = time.time()
+    async with get_redis().pipeline(transaction=False) as pipe:
+        pipe.zadd(key, {connection_member(user_id, channel_name): now})
+        pipe.zremrangebyscore(key, '-inf', now - settings.CHAT_PRESENCE_TTL)
+        pipe.expire(key, settings.CHAT_PRESENCE_TTL)
+        await pipe.execute()
+    return True
+
+
+async def leave(room_id, user_id, channel_name):
+    """Remove a connection and return whether the user is still online."""
+    client = get_redis()
+    key = presence_key(room_id)
+    await client.zrem(key, connection_member(user_id, channel_name))
+    cursor = 0
+    while True:
+        cursor, members = await client.zscan(key, cursor, match=f'{user_id}:*')
+        if members:
+            return True
+        if not cursor:
+            return False
+
+
+def get_online_users(room_id):
+    key = presence_key(room_id)
+    now = time.time()
+    with get_sync_redis().pipeline(transaction=False) as pipe:
+        pipe.zremrangebyscore(key, '-inf', now - settings.CHAT_PRESENCE_TTL)
+        pipe.zrange(key, 0, -1)
+        members = pipe.execute()[1]
+    return sorted({member.decode().split(':', 1)[0] for member in members})
+
+
+async def record_message(room_id, message_id):
+    """
+    Count a message accepted into the room and remember its position.
+    Done before the message is sent out, so a reader marking it read
+    always finds it, even while it is still waiting to be written.
+    """
+    await get_redis().eval(
+        RECORD_MESSAGE_SCRIPT, 2, message_count_key(room_id),
+        message_sequence_key(room_id, message_id), settings.CHAT_READ_SEQUENCE_TTL)
+
+
+def record_message_sync(room_id, message_id):
+    get_sync_redis().eval(
+        RECORD_MESSAGE_SCRIPT, 2, message_count_key(room_id),
+        message_sequence_key(room_id, message_id), settings.CHAT_READ_SEQUENCE_TTL)
+
+
+async def mark_read(room_id, user_id, message_id):
+    """
+    Mark the room read up to and including ``message_id`` and return True.
+    Messages posted after it stay unread. Messages whose position has
+    expired, or that were never counted, leave the marker where it is.
+    """
+    await get_redis().eval(
+        MARK_READ_SCRIPT, 3, message_sequence_key(room_id, message_id),
+        read_count_key(room_id), read_message_key(room_id),
+        str(user_id), str(message_id))
+    return True
+
+
+def get_unread_counts(room_ids, user_id):
+    room_ids = list(room_ids)
+    with get_sync_redis().pipeline(transaction=False) as pipe:
+        for room_id in room_ids:
+            pipe.get(message_count_key(room_id))
+            pipe.hget(read_count_key(room_id), str(user_id))
+        values = pipe.execute()
+    return {
+        str(room_id): max(0, int(values[2 * index] or 0) -
+                          int(values[2 * index + 1] or 0))
+        for index, room_id in enumerate(room_ids)
+    }
@@ -0,0 +1,45 @@
+import time
+import weakref
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """
+    Classic token bucket: ``rate`` tokens are added per second up to
+    ``capacity``, and each message spends one.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self, tokens=1):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+# Room buckets are shared by every connection to the room in this process
+# and dropped once the last of them goes away.
+_room_buckets = weakref.WeakValueDictionary()
+
+
+def get_connection_bucket():
+    rate, capacity = settings.CHAT_CONNECTION_RATE_LIMIT
+    return TokenBucket(rate, capacity)
+
+
+def get_room_bucket(room_id):
+    bucket = _room_buckets.get(room_id)
+    if bucket is None:
+        rate, capacity = settings.CHAT_ROOM_RATE_LIMIT
+        bucket = _room_buckets[room_id] = TokenBucket(rate, capacity)
+    return bucket
@@ -1,8 +1,11 @@
 
 
+from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from .models import ChatRoom, ChatMessage
 
+User = get_user_model()
+
 
 class ChatRoomSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,7 +13,22 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ChatAuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'first_name', 'last_name', 'image')
+
+
+# Only the author columns ChatAuthorSerializer reads are loaded with history.
+AUTHOR_FIELDS = tuple(
+    f'user__{field}' for field in ChatAuthorSerializer.Meta.fields)
+
+
 class ChatMessageSerializer(serializers.ModelSerializer):
+    user = ChatAuthorSerializer(read_only=True)
+
     class Meta:
         model = ChatMessage
         fields = '__all__'
+        # Messages are always posted to the room in the URL.
+        read_only_fields = ('room',)
@@ -1,8 +1,18 @@
+import logging
+
+from redis.exceptions import RedisError
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import NotFound  # Import NotFound exception
+from rest_framework.response import Response
+from . import presence
 from .models import ChatRoom, ChatMessage
-from .serializer import ChatRoomSerializer, ChatMessageSerializer
+from .pagination import ChatMessagePagination
+from .permissions import IsRoomMember, get_joinable_rooms
+from .serializer import AUTHOR_FIELDS, ChatRoomSerializer, ChatMessageSerializer
+
+logger = logging.getLogger(__name__)
 
 
 class ChatRoomViewSet(viewsets.ModelViewSet):
@@ -10,11 +20,36 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     serializer_class = ChatRoomSerializer
     permission_classes = [IsAuthenticated]
 
+    @action(detail=False)
+    def unread(self, request):
+        """Unread message counts for the current user, keyed by room id."""
+        room_ids = list(get_joinable_rooms(
+            request.user).values_list('id', flat=True))
+        try:
+            counts = presence.get_unread_counts(room_ids, request.user.pk)
+        except RedisError:
+            logger.warning("Failed to read chat unread counters", exc_info=True)
+            counts = {str(room_id): 0 for room_id in room_ids}
+        return Response(counts)
+
+    @action(detail=True, permission_classes=[IsAuthenticated, IsRoomMember],
+            queryset=ChatRoom.objects.select_related('course'))
+    def presence(self, request, pk=None):
+        """Ids of the users currently connected to the room."""
+        room = self.get_object()
+        try:
+            online = presence.get_online_users(room.pk)
+        except RedisError:
+            logger.warning("Failed to read chat presence", exc_info=True)
+            online = []
+        return Response({'online': online})
+
 
 class ChatMessageViewSet(viewsets.ModelViewSet):
     queryset = ChatMessage.objects.all()
     serializer_class = ChatMessageSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsRoomMember]
+    pagination_class = ChatMessagePagination
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
@@ -23,7 +58,13 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
         room_id = self.kwargs.get('room_id')
         if room_id is None:
             raise NotFound(detail='room_id parameter is required.')
-        return ChatMessage.objects.filter(room__id=room_id)
+        return ChatMessage.objects.filter(room_id=room_id).select_related('user').only(
+            'id', 'room_id', 'content', 'timestamp', *AUTHOR_FIELDS)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        message = serializer.save(
+            user=self.request.user, room_id=self.kwargs['room_id'])
+        try:
+            presence.record_message_sync(message.room_id, message.id)
+        except RedisError:
+            logger.warning("Failed to update chat unread counter", exc_info=True)
@@ -1,19 +1,23 @@
 import os
 from dotenv import load_dotenv
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from chat.routing import websocket_urlpatterns
 
 load_dotenv()
 environment = os.environ.get('ENVIRONMENT')
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE',
-                      'configuration.settings'+environment)
+                      'configuration.settings.' + environment)
+
+# Django has to be set up before anything that imports models.
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from chat.middleware import JWTAuthMiddlewareStack  # noqa: E402
+from chat.routing import websocket_urlpatterns  # noqa: E402
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app,
+    "websocket": JWTAuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
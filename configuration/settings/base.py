@@ -33,6 +33,7 @@ INSTALLED_APPS = [
     'channels',
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     'django_rest_passwordreset',
     'fcm_django',
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
     'course',
     'chat',
     'subscription',
+    'mailer',
 
 ]
 
@@ -178,19 +180,45 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 SERVER_EMAIL = EMAIL_HOST_USER
 
+# Outbox delivery (mailer.send_queued_mail): failed sends are retried with
+# exponential backoff starting at MAIL_RETRY_BACKOFF seconds, and marked
+# failed after MAIL_MAX_ATTEMPTS. A worker claims a batch for
+# MAIL_SEND_LEASE seconds; rows it has not settled by then are claimed again.
+MAIL_MAX_ATTEMPTS = 5
+MAIL_RETRY_BACKOFF = 60
+MAIL_SEND_LEASE = 600
+
 
 SITE_ID = 1
 
 REST_FRAMEWORK = {
     # 'EXCEPTION_HANDLER': 'utils.custom_exception.custom_exception_handler',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.tokens.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Sliding window limits for authentication.throttling, per client IP
+    # and per submitted email address.
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_email': '5/min',
+        'register_ip': '10/hour',
+        'register_email': '5/hour',
+        'otp_ip': '30/hour',
+        'otp_email': '10/hour',
+    },
+    # Reverse proxies in front of the app. Throttles take the client IP
+    # from that many hops back in X-Forwarded-For, or from REMOTE_ADDR when
+    # 0; left unset, DRF keys on the whole client-supplied header.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
+# Redis shared by every worker for the throttle windows. Without it each
+# process keeps its own windows.
+THROTTLE_REDIS_URL = os.getenv('THROTTLE_REDIS_URL')
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
@@ -224,8 +252,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "authentication.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "authentication.serializers.ClaimsTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -233,11 +261,111 @@ SIMPLE_JWT = {
 }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Serialized course/module detail payloads; invalidated by version bumps.
+COURSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Paystack API client (subscription.paystack). PAYSTACK_TIMEOUT is
+# (connect, read) seconds; GETs are retried up to PAYSTACK_MAX_RETRIES times.
+# After PAYSTACK_BREAKER_THRESHOLD consecutive failures calls fail fast for
+# PAYSTACK_BREAKER_RESET seconds.
+PAYSTACK_BASE_URL = 'https://api.paystack.co'
+PAYSTACK_SECRET_KEY = os.getenv('PAYSTACK_SECRET_KEY')
+PAYSTACK_TIMEOUT = (3.05, 15)
+PAYSTACK_MAX_RETRIES = 2
+PAYSTACK_POOL_SIZE = 10
+PAYSTACK_BREAKER_THRESHOLD = 5
+PAYSTACK_BREAKER_RESET = 30
+
+# Webhook events are applied by process_paystack_events; an event that
+# fails PAYSTACK_EVENT_MAX_ATTEMPTS times is left in the inbox unprocessed.
+PAYSTACK_EVENT_MAX_ATTEMPTS = 5
+
+# Per-user subscription entitlements used to gate course content;
+# invalidated when a UserMembership or Subscription is saved.
+ENTITLEMENT_CACHE_ALIAS = 'default'
+ENTITLEMENT_CACHE_TIMEOUT = 60 * 60
+
+# Refresh token blacklist checks (authentication.blacklist). Each process
+# keeps a bloom filter of blacklisted JTIs fed from a Redis stream and
+# rebuilt from the database every BLACKLIST_FILTER_REBUILD_INTERVAL
+# seconds. Without BLACKLIST_REDIS_URL every check queries the database.
+# Publishing a jti is tried BLACKLIST_PUBLISH_ATTEMPTS times, backing off
+# from BLACKLIST_PUBLISH_BACKOFF seconds, then again before the next check.
+BLACKLIST_REDIS_URL = os.getenv('BLACKLIST_REDIS_URL')
+BLACKLIST_FILTER_CAPACITY = 1_000_000
+BLACKLIST_FILTER_ERROR_RATE = 0.001
+BLACKLIST_FILTER_REBUILD_INTERVAL = 60 * 60
+BLACKLIST_STREAM_MAXLEN = 100_000
+BLACKLIST_PUBLISH_ATTEMPTS = 3
+BLACKLIST_PUBLISH_BACKOFF = 0.05
+
+# Okta access tokens (authentication.middleware.OktaAuthentication). Signing
+# keys are refetched every OKTA_JWKS_TTL seconds, or on an unknown kid at
+# most every OKTA_JWKS_MIN_REFRESH seconds. The token's sub is matched
+# against CustomUser.OKTA_USER_FIELD.
+OKTA_ISSUER = os.getenv('OKTA_ISSUER')
+OKTA_AUDIENCE = os.getenv('OKTA_AUDIENCE', 'api://default')
+OKTA_JWKS_URL = os.getenv('OKTA_JWKS_URL', f'{OKTA_ISSUER}/v1/keys')
+OKTA_ALGORITHMS = ['RS256']
+OKTA_JWKS_TTL = 60 * 60
+OKTA_JWKS_MIN_REFRESH = 60
+OKTA_CLAIMS_CACHE_SIZE = 1024
+OKTA_USER_FIELD = 'email'
+OKTA_USER_CACHE_TIMEOUT = 60 * 5
+
+# One-time passwords: valid for OTP_TTL seconds and OTP_MAX_ATTEMPTS guesses.
+OTP_STORE = 'authentication.otp.CacheOTPStore'
+OTP_CACHE_ALIAS = 'default'
+OTP_LENGTH = 6
+OTP_TTL = 60 * 10
+OTP_MAX_ATTEMPTS = 5
+
+# Chat messages are persisted in batches of up to CHAT_WRITE_BATCH_SIZE,
+# flushed at least every CHAT_WRITE_FLUSH_INTERVAL_MS. A batch that fails to
+# write is retried with backoff, up to CHAT_WRITE_MAX_ATTEMPTS times.
+CHAT_WRITE_BATCH_SIZE = 200
+CHAT_WRITE_FLUSH_INTERVAL_MS = 250
+CHAT_WRITE_MAX_ATTEMPTS = 5
+
+# Token buckets as (messages per second, burst), per connection and per
+# room within a worker process.
+CHAT_CONNECTION_RATE_LIMIT = (5, 10)
+CHAT_ROOM_RATE_LIMIT = (50, 100)
+
+# Presence, typing and read markers. Connections without a heartbeat for
+# CHAT_PRESENCE_TTL seconds count as offline; typing events are sent at
+# most every CHAT_TYPING_INTERVAL seconds per connection. A message can be
+# marked read for CHAT_READ_SEQUENCE_TTL seconds after it is posted.
+CHAT_REDIS_URL = os.getenv('CHAT_REDIS_URL', 'redis://127.0.0.1:6379/2')
+CHAT_PRESENCE_TTL = 60
+CHAT_TYPING_INTERVAL = 3
+CHAT_READ_SEQUENCE_TTL = 7 * 24 * 60 * 60
+
+# Clients using a chat.json/chat.msgpack subprotocol get events coalesced
+# for up to CHAT_COALESCE_WINDOW_MS, at most CHAT_COALESCE_MAX_EVENTS a frame.
+CHAT_COALESCE_WINDOW_MS = 25
+CHAT_COALESCE_MAX_EVENTS = 100
+
+
+# Comma separated Redis URLs. Groups and channels are spread over the
+# hosts on a consistent hash ring (see chat.layers.ShardedChannelLayer).
+CHANNEL_REDIS_HOSTS = [
+    host.strip() for host in
+    os.getenv('CHANNEL_REDIS_HOSTS', 'redis://127.0.0.1:6379').split(',')
+    if host.strip()
+]
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'chat.layers.ShardedChannelLayer',
         'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],
+            "hosts": CHANNEL_REDIS_HOSTS,
         },
     },
 }
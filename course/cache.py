@@ -0,0 +1,103 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Module
+
+VERSION_KEY = 'course:{kind}:{pk}:version'
+PAYLOAD_KEY = 'course:{kind}:{pk}:v{version}'
+WRITTEN_KEY = 'course:{kind}:{pk}:written_on'
+MODULE_COURSE_KEY = 'course:module:{pk}:course'
+
+
+def get_version(kind, pk):
+    key = VERSION_KEY.format(kind=kind, pk=pk)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock rather than 1 so that an evicted counter can
+        # never be re-created at a value an old payload was stored under.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(kind, pk):
+    key = VERSION_KEY.format(kind=kind, pk=pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+    # A deleted row leaves no updated_on behind, so the time of the last
+    # write is kept for Last-Modified as well.
+    cache.set(WRITTEN_KEY.format(kind=kind, pk=pk), timezone.now(), None)
+
+
+def get_written_on(*objects):
+    """
+    Return when the latest of the ``(kind, pk)`` objects was last written,
+    or None if no write has been recorded for any of them.
+    """
+    keys = [WRITTEN_KEY.format(kind=kind, pk=pk) for kind, pk in objects]
+    return max(cache.get_many(keys).values(), default=None)
+
+
+def get_last_modified(*timestamps):
+    return max((timestamp for timestamp in timestamps if timestamp is not None), default=None)
+
+
+def bump_version_on_commit(kind, pk):
+    # Bumping before commit would let a concurrent reader cache the old rows
+    # under the new version.
+    if pk is not None:
+        transaction.on_commit(lambda: bump_version(kind, pk))
+
+
+def get_cached_detail(kind, pk, build):
+    """
+    Read-through cache for serialized detail payloads.
+
+    ``build`` is only called on a miss and returns the payload and the
+    latest ``updated_on`` among its rows. Both are stored under the
+    object's current version, so a version bump makes every older payload
+    unreachable without having to delete it. Returns the payload, the
+    version it is stored under, which callers use as the ETag, and its
+    Last-Modified time.
+    """
+    version = get_version(kind, pk)
+    key = PAYLOAD_KEY.format(kind=kind, pk=pk, version=version)
+    cached = cache.get(key)
+    if cached is None:
+        data, updated_on = build()
+        cached = (data, get_last_modified(updated_on, get_written_on((kind, pk))))
+        cache.set(key, cached, settings.COURSE_CACHE_TIMEOUT)
+    data, last_modified = cached
+    return data, version, last_modified
+
+
+def get_module_course_id(module_id):
+    """
+    Return the id of the course ``module_id`` belongs to.
+
+    The answer is cached until the module is saved or deleted, so saving a
+    video, attachment or assignment can bump its course's version without
+    looking the module up.
+    """
+    key = MODULE_COURSE_KEY.format(pk=module_id)
+    course_id = cache.get(key)
+    if course_id is None:
+        course_id = Module.objects.filter(
+            pk=module_id).values_list('course_id', flat=True).first()
+        if course_id is not None:
+            cache.set(key, course_id, None)
+    return course_id
+
+
+def set_module_course_id(module_id, course_id):
+    key = MODULE_COURSE_KEY.format(pk=module_id)
+    if course_id is None:
+        cache.delete(key)
+    else:
+        cache.set(key, course_id, None)
@@ -0,0 +1,67 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from .models import AssignmentAnswer, Course, Review
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_RESOURCES = {
+    'courses': (Course, ['id', 'user_id', 'course_title', 'detail', 'banner_image', 'modules', 'level',
+                         'class_per_modules', 'is_document', 'is_ongoing', 'is_completed', 'created_on', 'updated_on']),
+    'reviews': (Review, ['id', 'user_id', 'module_id', 'rating', 'review', 'created_on', 'updated_on']),
+    'answers': (AssignmentAnswer, ['id', 'assignment_id', 'user_id', 'text_answer', 'file_answer', 'grade',
+                                   'created_on', 'updated_on']),
+}
+
+
+class Echo:
+    """File-like object that hands back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """
+    Exports are streamed as CSV or NDJSON whatever the Accept header says,
+    so only error bodies go through a renderer. Those fall back to the
+    first renderer instead of answering ``Accept: text/csv`` with 406.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+def get_export_rows(resource, updated_since=None):
+    """
+    Return ``(fields, rows)`` for an export, where ``rows`` lazily yields
+    value tuples ``EXPORT_CHUNK_SIZE`` at a time.
+
+    Rows come out in ``(updated_on, id)`` order so that the last row's
+    ``updated_on`` is a safe ``updated_since`` watermark for the next pull.
+    """
+    model, fields = EXPORT_RESOURCES[resource]
+    queryset = model.objects.order_by('updated_on', 'id')
+    if updated_since is not None:
+        queryset = queryset.filter(updated_on__gte=updated_since)
+    return fields, queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def stream_ndjson(fields, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def stream_csv(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
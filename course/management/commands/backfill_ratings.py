@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from course.cache import bump_version_on_commit
+from course.models import Course, Module, Review
+from course.ratings import RATING_VALUES
+
+AGGREGATE_FIELDS = ['rating_count', 'rating_sum'] + \
+    [f'rating_count_{rating}' for rating in RATING_VALUES]
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized module and course rating aggregates from Review rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        review_totals = {
+            'rating_count': Count('id'),
+            'rating_sum': Sum('rating'),
+            **{f'rating_count_{rating}': Count('id', filter=Q(rating=rating)) for rating in RATING_VALUES},
+        }
+        module_totals = {field: Sum(field) for field in AGGREGATE_FIELDS}
+
+        modules = self.backfill(
+            Module, Review.objects.values('module_id'), 'module_id', review_totals, batch_size)
+        courses = self.backfill(
+            Course, Module.objects.values('course_id'), 'course_id', module_totals, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {modules} modules and {courses} courses."))
+
+    def backfill(self, model, source, group_field, totals, batch_size):
+        kind = model._meta.model_name
+        updated = 0
+        ids = model.objects.order_by('pk').values_list('pk', flat=True)
+        batch = []
+        for pk in ids.iterator(chunk_size=batch_size):
+            batch.append(pk)
+            if len(batch) == batch_size:
+                updated += self.backfill_batch(
+                    model, kind, batch, source, group_field, totals)
+                batch = []
+        if batch:
+            updated += self.backfill_batch(model, kind,
+                                           batch, source, group_field, totals)
+        return updated
+
+    def backfill_batch(self, model, kind, batch, source, group_field, totals):
+        now = timezone.now()
+        changed = []
+        with transaction.atomic():
+            instances = list(model.objects.filter(
+                pk__in=batch).select_for_update().only('pk', *AGGREGATE_FIELDS))
+            rows = source.filter(
+                **{f'{group_field}__in': batch}).order_by().annotate(**totals)
+            expected = {row[group_field]: row for row in rows}
+            for instance in instances:
+                row = expected.get(instance.pk, {})
+                values = {field: row.get(field) or 0 for field in AGGREGATE_FIELDS}
+                if all(getattr(instance, field) == value for field, value in values.items()):
+                    continue
+                for field, value in values.items():
+                    setattr(instance, field, value)
+                instance.updated_on = now
+                changed.append(instance)
+                bump_version_on_commit(kind, instance.pk)
+            model.objects.bulk_update(
+                changed, AGGREGATE_FIELDS + ['updated_on'])
+        return len(changed)
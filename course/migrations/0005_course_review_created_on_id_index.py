@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("course", "0004_remove_assignmentanswer_module_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["-created_on", "-id"], name="course_created_on_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["-created_on", "-id"], name="review_created_on_id_idx"
+            ),
+        ),
+    ]
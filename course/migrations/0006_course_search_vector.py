@@ -0,0 +1,68 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:56
+
+import course.models
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_FORWARDS = [
+    # Created here rather than with TrigramExtension, whose module needs
+    # psycopg even when migrating the SQLite development database.
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "UPDATE course_course SET search_vector = "
+    "setweight(to_tsvector('english', coalesce(course_title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(detail, '')), 'B')",
+]
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS course_course_fts USING fts5("
+    "course_id UNINDEXED, course_title, detail, tokenize='porter unicode61')",
+    "INSERT INTO course_course_fts (course_id, course_title, detail) "
+    "SELECT id, course_title, coalesce(detail, '') FROM course_course",
+]
+SQLITE_BACKWARDS = [
+    "DROP TABLE IF EXISTS course_course_fts",
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("course", "0005_course_review_created_on_id_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(
+            run_statements(
+                {"postgresql": POSTGRESQL_FORWARDS, "sqlite": SQLITE_FORWARDS}
+            ),
+            run_statements({"sqlite": SQLITE_BACKWARDS}),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=course.models.PortableGinIndex(
+                fields=["search_vector"], name="course_search_vector_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=course.models.PortableGinIndex(
+                fields=["course_title"],
+                name="course_title_trgm_gin",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
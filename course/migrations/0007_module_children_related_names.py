@@ -0,0 +1,50 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("course", "0006_course_search_vector"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="assignment",
+            name="module",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="assignments",
+                to="course.module",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="assignmentanswer",
+            name="assignment",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="answers",
+                to="course.assignment",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="attachment",
+            name="module",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="attachments",
+                to="course.module",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="video",
+            name="module",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="videos",
+                to="course.module",
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("course", "0007_module_children_related_names"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="review",
+            name="updated_on",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="assignmentanswer",
+            index=models.Index(
+                fields=["updated_on", "id"], name="answer_updated_on_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["updated_on", "id"], name="course_updated_on_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["updated_on", "id"], name="review_updated_on_id_idx"
+            ),
+        ),
+    ]
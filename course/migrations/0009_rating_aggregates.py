@@ -0,0 +1,133 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:03
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("course", "0008_export_watermark_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="module",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="module",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="rating_count_1",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="rating_count_2",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="rating_count_3",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="rating_count_4",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="rating_count_5",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="module",
+            name="rating_count_1",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="module",
+            name="rating_count_2",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="module",
+            name="rating_count_3",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="module",
+            name="rating_count_4",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="module",
+            name="rating_count_5",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="rating_average",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=models.Case(
+                    models.When(rating_count=0, then=models.Value(0.0)),
+                    default=django.db.models.expressions.CombinedExpression(
+                        django.db.models.functions.comparison.Cast(
+                            "rating_sum", models.FloatField()
+                        ),
+                        "/",
+                        django.db.models.functions.comparison.Cast(
+                            "rating_count", models.FloatField()
+                        ),
+                    ),
+                ),
+                output_field=models.FloatField(),
+            ),
+        ),
+        migrations.AddField(
+            model_name="module",
+            name="rating_average",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=models.Case(
+                    models.When(rating_count=0, then=models.Value(0.0)),
+                    default=django.db.models.expressions.CombinedExpression(
+                        django.db.models.functions.comparison.Cast(
+                            "rating_sum", models.FloatField()
+                        ),
+                        "/",
+                        django.db.models.functions.comparison.Cast(
+                            "rating_count", models.FloatField()
+                        ),
+                    ),
+                ),
+                output_field=models.FloatField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["-rating_average", "-id"], name="course_rating_average_id_idx"
+            ),
+        ),
+    ]
@@ -1,5 +1,9 @@
 import uuid
 from django.db import models
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -15,17 +19,66 @@ def get_banner_image_upload_path(instance, filename):
     return folder_path + filename
 
 
+def get_upload_folder_id(instance):
+    # Videos, attachments and assignments are filed under their module,
+    # assignment answers under their assignment.
+    return getattr(instance, 'module_id', None) or getattr(instance, 'assignment_id', None)
+
+
 def get_video_banner_upload_path(instance, filename):
-    folder_path = f"class/course/videos/banner/{instance.class_id}/{timezone.now().strftime('%Y/%m/%d')}/"
+    folder_path = f"class/course/videos/banner/{get_upload_folder_id(instance)}/{timezone.now().strftime('%Y/%m/%d')}/"
     return folder_path + filename
 
 
 def get_attachment_upload_path(instance, filename):
-    folder_path = f"class/course/videos/document/{instance.class_id}/{timezone.now().strftime('%Y/%m/%d')}/"
+    folder_path = f"class/course/videos/document/{get_upload_folder_id(instance)}/{timezone.now().strftime('%Y/%m/%d')}/"
     return folder_path + filename
 
 
-class Course(models.Model):
+class PortableGinIndex(GinIndex):
+    """
+    GIN index on PostgreSQL. Other databases (SQLite in development) have
+    no GIN, so they get a plain index under the same name instead.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        return models.Index(fields=self.fields, name=self.name).create_sql(
+            model, schema_editor, **kwargs)
+
+
+class RatingAggregate(models.Model):
+    """
+    Denormalized review counters, kept current by course.signals with F()
+    updates so listings can sort and filter on rating without aggregating.
+    """
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count_1 = models.PositiveIntegerField(default=0)
+    rating_count_2 = models.PositiveIntegerField(default=0)
+    rating_count_3 = models.PositiveIntegerField(default=0)
+    rating_count_4 = models.PositiveIntegerField(default=0)
+    rating_count_5 = models.PositiveIntegerField(default=0)
+    rating_average = models.GeneratedField(
+        expression=Case(
+            When(rating_count=0, then=Value(0.0)),
+            default=Cast('rating_sum', models.FloatField()) /
+            Cast('rating_count', models.FloatField()),
+        ),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        abstract = True
+
+    @property
+    def rating_histogram(self):
+        return {rating: getattr(self, f'rating_count_{rating}') for rating in range(1, 6)}
+
+
+class Course(RatingAggregate):
     id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False, db_index=True)
     user = models.ForeignKey(
@@ -41,17 +94,31 @@ class Course(models.Model):
     is_document = models.BooleanField(default=True)
     is_ongoing = models.BooleanField(default=False)
     is_completed = models.BooleanField(default=False)
+    # Maintained by course.signals; GIN indexed on PostgreSQL.
+    search_vector = SearchVectorField(null=True, editable=False)
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_on']
+        indexes = [
+            models.Index(fields=['-created_on', '-id'],
+                         name='course_created_on_id_idx'),
+            models.Index(fields=['updated_on', 'id'],
+                         name='course_updated_on_id_idx'),
+            models.Index(fields=['-rating_average', '-id'],
+                         name='course_rating_average_id_idx'),
+            PortableGinIndex(fields=['search_vector'],
+                             name='course_search_vector_gin'),
+            PortableGinIndex(fields=['course_title'], opclasses=['gin_trgm_ops'],
+                             name='course_title_trgm_gin'),
+        ]
 
     def __str__(self):
         return str(self.course_title)
 
 
-class Module(models.Model):
+class Module(RatingAggregate):
     id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False, db_index=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
@@ -75,7 +142,8 @@ class Module(models.Model):
 class Video(models.Model):
     id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False, db_index=True)
-    module = models.ForeignKey(Module, on_delete=models.CASCADE)
+    module = models.ForeignKey(
+        Module, related_name='videos', on_delete=models.CASCADE)
     title = models.CharField(max_length=250)
     video_url = models.TextField(db_index=True, null=False, blank=False)
     thumnail = models.ImageField(
@@ -96,7 +164,8 @@ class Video(models.Model):
 class Attachment(models.Model):
     id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False, db_index=True)
-    module = models.ForeignKey(Module, on_delete=models.CASCADE)
+    module = models.ForeignKey(
+        Module, related_name='attachments', on_delete=models.CASCADE)
     title = models.CharField(max_length=250)
     document = models.FileField(
         upload_to=get_attachment_upload_path, null=True, blank=True)
@@ -113,7 +182,8 @@ class Attachment(models.Model):
 class Assignment(models.Model):
     id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False, db_index=True)
-    module = models.ForeignKey(Module, on_delete=models.CASCADE)
+    module = models.ForeignKey(
+        Module, related_name='assignments', on_delete=models.CASCADE)
     title = models.CharField(max_length=250)
     description = models.TextField(db_index=True, null=False, blank=False)
     content_type = models.CharField(
@@ -136,7 +206,8 @@ class Assignment(models.Model):
 class AssignmentAnswer(models.Model):
     id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False, db_index=True)
-    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE)
+    assignment = models.ForeignKey(
+        Assignment, related_name='answers', on_delete=models.CASCADE)
     user = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE)
     text_answer = models.TextField(null=True, blank=True)
@@ -149,6 +220,10 @@ class AssignmentAnswer(models.Model):
 
     class Meta:
         ordering = ['-created_on']
+        indexes = [
+            models.Index(fields=['updated_on', 'id'],
+                         name='answer_updated_on_id_idx'),
+        ]
 
     def __str__(self):
         return str(self.title)
@@ -163,9 +238,16 @@ class Review(models.Model):
         validators=[MinValueValidator(1), MaxValueValidator(5)])
     review = models.TextField(db_index=True)
     created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_on']
+        indexes = [
+            models.Index(fields=['-created_on', '-id'],
+                         name='review_created_on_id_idx'),
+            models.Index(fields=['updated_on', 'id'],
+                         name='review_updated_on_id_idx'),
+        ]
 
     def __str__(self):
         return f"Review by {self.user.email}"
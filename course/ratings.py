@@ -0,0 +1,44 @@
+from collections import Counter
+
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import bump_version_on_commit, get_module_course_id
+from .models import Course, Module
+
+RATING_VALUES = range(1, 6)
+
+
+def get_rating_deltas(rating, sign):
+    return {
+        'rating_count': sign,
+        'rating_sum': sign * rating,
+        f'rating_count_{rating}': sign,
+    }
+
+
+def apply_rating_change(module_id, old_rating=None, new_rating=None):
+    """
+    Move one review's contribution on ``module_id`` and its course from
+    ``old_rating`` to ``new_rating`` (either may be None for create/delete).
+
+    Counters are adjusted with ``F()`` expressions, so concurrent reviews
+    never overwrite each other's increments.
+    """
+    deltas = Counter()
+    if old_rating is not None:
+        deltas.update(get_rating_deltas(old_rating, -1))
+    if new_rating is not None:
+        deltas.update(get_rating_deltas(new_rating, 1))
+    updates = {field: F(field) + delta for field,
+               delta in deltas.items() if delta}
+    if not updates:
+        return
+
+    # updated_on moves too, so ETags and export watermarks see the change.
+    updates['updated_on'] = timezone.now()
+    course_id = get_module_course_id(module_id)
+    Module.objects.filter(pk=module_id).update(**updates)
+    Course.objects.filter(pk=course_id).update(**updates)
+    bump_version_on_commit('module', module_id)
+    bump_version_on_commit('course', course_id)
@@ -0,0 +1,97 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+SQLITE_FTS_TABLE = 'course_course_fts'
+TRIGRAM_THRESHOLD = 0.3
+
+
+def course_search_vector():
+    # Title matches outrank detail matches.
+    return (SearchVector('course_title', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('detail', weight='B', config=SEARCH_CONFIG))
+
+
+def get_search_terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+def update_course_search_index(course):
+    if connection.vendor == 'postgresql':
+        type(course).objects.filter(pk=course.pk).update(
+            search_vector=course_search_vector())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SQLITE_FTS_TABLE} WHERE course_id = %s", [course.pk.hex])
+            cursor.execute(
+                f"INSERT INTO {SQLITE_FTS_TABLE} (course_id, course_title, detail) VALUES (%s, %s, %s)",
+                [course.pk.hex, course.course_title, course.detail or ''])
+
+
+def remove_course_search_index(course):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SQLITE_FTS_TABLE} WHERE course_id = %s", [course.pk.hex])
+
+
+def search_courses(queryset, query, limit):
+    """
+    Return up to ``limit`` courses from ``queryset`` matching ``query``,
+    best match first.
+
+    Every term is matched as a prefix. On PostgreSQL the weighted
+    ``search_vector`` (GIN indexed) is used, falling back to trigram
+    similarity on the title when nothing matches so that typos still find
+    the course. SQLite uses the FTS5 table kept in sync by the course signals.
+    """
+    terms = get_search_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(queryset, query, terms, limit)
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(queryset, terms, limit)
+
+    filters = Q()
+    for term in terms:
+        filters &= Q(course_title__icontains=term) | Q(detail__icontains=term)
+    return list(queryset.filter(filters)[:limit])
+
+
+def _search_postgresql(queryset, query, terms, limit):
+    search_query = SearchQuery(
+        ' & '.join(f"{term}:*" for term in terms), search_type='raw', config=SEARCH_CONFIG)
+    results = list(
+        queryset.filter(search_vector=search_query)
+        .annotate(rank=SearchRank(F('search_vector'), search_query))
+        .order_by('-rank', '-created_on', '-id')[:limit])
+    if results:
+        return results
+
+    return list(
+        queryset.annotate(similarity=TrigramWordSimilarity(query, 'course_title'))
+        .filter(similarity__gt=TRIGRAM_THRESHOLD)
+        .order_by('-similarity', '-created_on', '-id')[:limit])
+
+
+def _search_sqlite(queryset, terms, limit):
+    match = ' '.join('"{}"*'.format(term) for term in terms)
+    table = queryset.model._meta.db_table
+    # Matched and ranked inside the course query, so the caller's filters
+    # and the limit apply to every match. bm25() weights: course_id
+    # (unindexed), course_title, detail; lower is better.
+    matches = RawSQL(
+        f"SELECT course_id FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s", [match])
+    rank = RawSQL(
+        f"SELECT bm25({SQLITE_FTS_TABLE}, 0.0, 10.0, 1.0) FROM {SQLITE_FTS_TABLE} "
+        f"WHERE {SQLITE_FTS_TABLE}.course_id = {table}.id AND {SQLITE_FTS_TABLE} MATCH %s", [match])
+    return list(
+        queryset.filter(id__in=matches).annotate(rank=rank)
+        .order_by('rank', '-created_on', '-id')[:limit])
@@ -1,8 +1,13 @@
 # serializers.py
 
+from django.db import transaction
 from rest_framework import serializers
+from .cache import bump_version_on_commit
 from .models import Review, Course,  Module, Video, Attachment, Assignment, AssignmentAnswer
 
+RATING_AGGREGATE_FIELDS = ['rating_count', 'rating_sum', 'rating_count_1', 'rating_count_2',
+                           'rating_count_3', 'rating_count_4', 'rating_count_5', 'rating_average']
+
 
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,11 +28,15 @@ class AssignmentSerializer(serializers.ModelSerializer):
 
 
 class CourseSerializer(serializers.ModelSerializer):
+    rating_histogram = serializers.ReadOnlyField()
+
     class Meta:
         model = Course
         fields = ['id', 'user', 'course_title', 'detail', 'banner_image', 'modules', 'level',
-                  'class_per_modules', 'is_document', 'is_ongoing', 'is_completed', 'created_on', 'updated_on']
-        read_only_fields = ['user', 'created_on', 'updated_on']
+                  'class_per_modules', 'is_document', 'is_ongoing', 'is_completed', 'rating_count',
+                  'rating_average', 'rating_histogram', 'created_on', 'updated_on']
+        read_only_fields = ['user', 'rating_count',
+                            'rating_average', 'created_on', 'updated_on']
 
 
 class VideoSerializer(serializers.ModelSerializer):
@@ -53,3 +62,66 @@ class ModuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Module
         fields = '__all__'
+        read_only_fields = RATING_AGGREGATE_FIELDS
+
+
+class AssignmentTreeSerializer(serializers.ModelSerializer):
+    assignment_answer = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Assignment
+        fields = '__all__'
+
+    def get_assignment_answer(self, obj):
+        # Populated by the `user_answers` Prefetch in CourseTreeAPIView.
+        answers = getattr(obj, 'user_answers', None)
+        if not answers:
+            return None
+        return AssignmentAnswerSerializer(answers[0]).data
+
+
+class ModuleTreeSerializer(serializers.ModelSerializer):
+    videos = VideoSerializer(many=True, read_only=True)
+    attachments = AttachmentSerializer(many=True, read_only=True)
+    assignments = AssignmentTreeSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Module
+        fields = '__all__'
+        read_only_fields = RATING_AGGREGATE_FIELDS
+
+
+class ModuleBulkListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        # The whole payload has already been validated; write it with one
+        # INSERT per table instead of one per row.
+        modules, videos, attachments = [], [], []
+        for module_data in validated_data:
+            videos_data = module_data.pop('videos', [])
+            attachments_data = module_data.pop('attachments', [])
+            module = Module(**module_data)
+            modules.append(module)
+            videos.extend(Video(module=module, **video_data)
+                          for video_data in videos_data)
+            attachments.extend(Attachment(module=module, **attachment_data)
+                               for attachment_data in attachments_data)
+
+        with transaction.atomic():
+            Module.objects.bulk_create(modules)
+            Video.objects.bulk_create(videos)
+            Attachment.objects.bulk_create(attachments)
+            # bulk_create sends no post_save, so invalidate explicitly.
+            for course_id in {module.course_id for module in modules}:
+                bump_version_on_commit('course', course_id)
+        return modules
+
+
+class ModuleIngestSerializer(serializers.ModelSerializer):
+    videos = VideoSerializer(many=True, required=False)
+    attachments = AttachmentSerializer(many=True, required=False)
+
+    class Meta:
+        model = Module
+        fields = '__all__'
+        read_only_fields = RATING_AGGREGATE_FIELDS
+        list_serializer_class = ModuleBulkListSerializer
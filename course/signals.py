@@ -0,0 +1,114 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_version_on_commit, get_module_course_id, set_module_course_id
+from .models import Assignment, AssignmentAnswer, Attachment, Course, Module, Review, Video
+from .ratings import apply_rating_change
+from .search import remove_course_search_index, update_course_search_index
+
+
+# SEARCH INDEX
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, *args, **kwargs):
+    update_course_search_index(instance)
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, *args, **kwargs):
+    remove_course_search_index(instance)
+
+
+# DETAIL CACHE VERSIONS
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def bump_course_cache(sender, instance, *args, **kwargs):
+    bump_version_on_commit('course', instance.pk)
+
+
+# The parent each row was loaded with. A save can move a module to another
+# course or a child to another module, and the old parent's cached detail
+# must be dropped too. Recorded when the row is loaded so saving a child
+# still costs no lookup.
+PARENT_FIELDS = {
+    Module: 'course_id',
+    Video: 'module_id',
+    Attachment: 'module_id',
+    Assignment: 'module_id',
+}
+
+
+@receiver(post_init, sender=Module)
+@receiver(post_init, sender=Video)
+@receiver(post_init, sender=Attachment)
+@receiver(post_init, sender=Assignment)
+def remember_cache_parent(sender, instance, *args, **kwargs):
+    # Read from __dict__ so a deferred field isn't loaded just for this.
+    instance._cache_parent_id = instance.__dict__.get(PARENT_FIELDS[sender])
+
+
+def get_cache_parent_ids(sender, instance):
+    parent_id = getattr(instance, PARENT_FIELDS[sender])
+    previous_id = getattr(instance, '_cache_parent_id', None)
+    instance._cache_parent_id = parent_id
+    return {parent_id, previous_id} - {None}
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def bump_module_cache(sender, instance, signal, *args, **kwargs):
+    set_module_course_id(
+        instance.pk, instance.course_id if signal is post_save else None)
+    bump_version_on_commit('module', instance.pk)
+    for course_id in get_cache_parent_ids(sender, instance):
+        bump_version_on_commit('course', course_id)
+
+
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Attachment)
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def bump_module_child_cache(sender, instance, *args, **kwargs):
+    for module_id in get_cache_parent_ids(sender, instance):
+        bump_version_on_commit('module', module_id)
+        bump_version_on_commit('course', get_module_course_id(module_id))
+
+
+@receiver(post_save, sender=AssignmentAnswer)
+@receiver(post_delete, sender=AssignmentAnswer)
+def bump_answers_cache(sender, instance, *args, **kwargs):
+    # Answers appear only in their author's views, so they are versioned
+    # per user rather than per course.
+    bump_version_on_commit('answers', instance.user_id)
+
+
+# RATING AGGREGATES
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, raw=False, *args, **kwargs):
+    instance._original_rating = None
+    if not raw:
+        instance._original_rating = Review.objects.filter(
+            pk=instance.pk).values_list('module_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_review_aggregates(sender, instance, raw=False, *args, **kwargs):
+    if raw:
+        return
+    original = getattr(instance, '_original_rating', None)
+    if original is None:
+        apply_rating_change(instance.module_id, new_rating=instance.rating)
+        return
+
+    module_id, rating = original
+    if module_id == instance.module_id:
+        apply_rating_change(module_id, rating, instance.rating)
+    else:
+        apply_rating_change(module_id, old_rating=rating)
+        apply_rating_change(instance.module_id, new_rating=instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_aggregates(sender, instance, *args, **kwargs):
+    apply_rating_change(instance.module_id, old_rating=instance.rating)
@@ -1,3 +1,561 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from authentication.models import CustomUser
+from subscription.entitlements import get_entitlement
+from subscription.models import Membership, UserMembership
+from .models import Assignment, AssignmentAnswer, Attachment, Course, Module, Review, Video
+from .cache import get_version
+from .search import search_courses
+from .serializers import ModuleIngestSerializer
+
+
+def make_image(name='image.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class CourseTreeAPIViewTests(TestCase):
+    # An existence check plus one fetch for each of course, modules, videos,
+    # attachments, assignments and answers. The ETag comes from cached
+    # version counters and the subscription check from the cached
+    # entitlement.
+    EXPECTED_QUERIES = 7
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password')
+        UserMembership.objects.create(
+            user=self.user, membership=Membership.objects.create(duration=30))
+        get_entitlement(self.user.pk)
+        self.course = Course.objects.create(
+            user=self.user, course_title='Course', banner_image='banner.png',
+            modules=0, class_per_modules=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('course-tree', kwargs={'pk': self.course.id})
+
+    def add_modules(self, count):
+        for index in range(count):
+            module = Module.objects.create(
+                course=self.course, title=f'Module {index}', thumnail='thumb.png')
+            Video.objects.create(
+                module=module, title='Video', video_url='https://example.com/v', thumnail='thumb.png')
+            Attachment.objects.create(module=module, title='Attachment')
+            assignment = Assignment.objects.create(
+                module=module, title='Assignment', description='Describe')
+            AssignmentAnswer.objects.create(
+                assignment=assignment, user=self.user, text_answer='Answer')
+
+    def test_query_count_is_independent_of_module_count(self):
+        for count in (1, 5):
+            self.add_modules(count)
+            with self.assertNumQueries(self.EXPECTED_QUERIES):
+                response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_tree_includes_children_and_callers_answer(self):
+        self.add_modules(2)
+        other = CustomUser.objects.create_user(
+            email='other@example.com', password='password')
+        assignment = Assignment.objects.first()
+        AssignmentAnswer.objects.create(
+            assignment=assignment, user=other, text_answer='Other answer')
+
+        response = self.client.get(self.url)
+
+        modules = response.data['data']['modules']
+        self.assertEqual(len(modules), 2)
+        for module in modules:
+            self.assertEqual(len(module['videos']), 1)
+            self.assertEqual(len(module['attachments']), 1)
+            self.assertEqual(
+                module['assignments'][0]['assignment_answer']['text_answer'], 'Answer')
+
+    def test_unchanged_tree_returns_304(self):
+        self.add_modules(1)
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_answer_change_alters_the_etag(self):
+        self.add_modules(1)
+        etag = self.client.get(self.url)['ETag']
+
+        answer = AssignmentAnswer.objects.get()
+        answer.text_answer = 'Changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            answer.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_course_returns_404(self):
+        url = reverse('course-tree', kwargs={
+                      'pk': '00000000-0000-0000-0000-000000000000'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+
+
+
+class DetailCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password')
+        UserMembership.objects.create(
+            user=self.user, membership=Membership.objects.create(duration=30))
+        self.course = Course.objects.create(
+            user=self.user, course_title='Course', banner_image='banner.png',
+            modules=0, class_per_modules=1)
+        self.module = Module.objects.create(
+            course=self.course, title='Module', thumnail='thumb.png')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_videos(self):
+        course = self.client.get(reverse('course-detail', kwargs={'pk': self.course.id}))
+        module = self.client.get(reverse('module-detail', kwargs={'pk': self.module.id}))
+        return (
+            [video['title'] for video in course.data['data']['modules'][0]['videos']],
+            [video['title'] for video in module.data['data']['videos']],
+        )
+
+    def test_version_is_bumped_when_the_transaction_commits(self):
+        version = get_version('course', self.course.pk)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.course.save()
+            self.assertEqual(get_version('course', self.course.pk), version)
+        for callback in callbacks:
+            callback()
+
+        self.assertGreater(get_version('course', self.course.pk), version)
+
+    def test_child_save_invalidates_course_and_module_detail(self):
+        self.assertEqual(self.get_videos(), ([], []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            video = Video.objects.create(
+                module=self.module, title='Intro', video_url='https://example.com/v', thumnail='thumb.png')
+        self.assertEqual(self.get_videos(), (['Intro'], ['Intro']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            video.delete()
+        self.assertEqual(self.get_videos(), ([], []))
+
+    def test_cached_detail_is_revalidated_without_queries(self):
+        url = reverse('course-detail', kwargs={'pk': self.course.id})
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_is_revalidated_with_if_modified_since(self):
+        for url in (reverse('course-detail', kwargs={'pk': self.course.id}),
+                    reverse('module-detail', kwargs={'pk': self.module.id})):
+            last_modified = self.client.get(url)['Last-Modified']
+
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+            self.assertEqual(response.status_code, 304)
+
+    def test_assignment_is_revalidated_with_if_modified_since(self):
+        assignment = Assignment.objects.create(
+            module=self.module, title='Assignment', description='Answer it')
+        url = reverse('assignment-detail', kwargs={'pk': assignment.id})
+        last_modified = self.client.get(url)['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_deleting_a_child_moves_last_modified_forward(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            video = Video.objects.create(
+                module=self.module, title='Intro', video_url='https://example.com/v', thumnail='thumb.png')
+        url = reverse('course-detail', kwargs={'pk': self.course.id})
+        last_modified = self.client.get(url)['Last-Modified']
+
+        later = timezone.now() + timedelta(minutes=1)
+        with mock.patch('course.cache.timezone.now', return_value=later), \
+                self.captureOnCommitCallbacks(execute=True):
+            video.delete()
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['modules'][0]['videos'], [])
+
+    def test_unknown_course_is_not_matched_by_if_none_match(self):
+        url = reverse('course-detail', kwargs={
+                      'pk': '00000000-0000-0000-0000-000000000000'})
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+    def test_moving_a_module_invalidates_both_courses(self):
+        other_course = Course.objects.create(
+            user=self.user, course_title='Other', banner_image='banner.png',
+            modules=0, class_per_modules=1)
+        urls = [reverse('course-detail', kwargs={'pk': course.id})
+                for course in (self.course, other_course)]
+        self.assertEqual([len(self.client.get(url).data['data']['modules']) for url in urls], [1, 0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('module-detail', kwargs={'pk': self.module.id}),
+                {'course': str(other_course.id)}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(self.client.get(url).data['data']['modules']) for url in urls], [0, 1])
+
+    def test_moving_a_child_invalidates_both_modules(self):
+        other_module = Module.objects.create(
+            course=self.course, title='Other', thumnail='thumb.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            video = Video.objects.create(
+                module=self.module, title='Intro', video_url='https://example.com/v', thumnail='thumb.png')
+        self.assertEqual(self.get_videos()[1], ['Intro'])
+
+        video = Video.objects.get(pk=video.pk)
+        video.module = other_module
+        with self.captureOnCommitCallbacks(execute=True):
+            video.save()
+
+        self.assertEqual(self.get_videos()[1], [])
+
+    def test_child_save_does_not_look_up_its_module(self):
+        video = Video.objects.create(
+            module=self.module, title='Intro', video_url='https://example.com/v', thumnail='thumb.png')
+
+        video = Video.objects.get(pk=video.pk)
+
+        with self.assertNumQueries(1):
+            video.save()
+
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password')
+        self.course = Course.objects.create(
+            user=self.user, course_title='Course', banner_image='banner.png',
+            modules=0, class_per_modules=1)
+        self.module = Module.objects.create(
+            course=self.course, title='Module', thumnail='thumb.png')
+        self.other_module = Module.objects.create(
+            course=self.course, title='Other', thumnail='thumb.png')
+
+    def review(self, rating, module=None):
+        return Review.objects.create(
+            user=self.user, module=module or self.module, rating=rating, review='Review')
+
+    def assertAggregates(self, instance, count, total, histogram):
+        instance.refresh_from_db()
+        self.assertEqual(instance.rating_count, count)
+        self.assertEqual(instance.rating_sum, total)
+        self.assertEqual(instance.rating_histogram, histogram)
+        self.assertEqual(instance.rating_average, total / count if count else 0)
+
+    def test_create_update_and_delete_move_the_counters(self):
+        first = self.review(5)
+        self.review(3)
+        self.assertAggregates(self.module, 2, 8, {1: 0, 2: 0, 3: 1, 4: 0, 5: 1})
+
+        first.rating = 1
+        first.save()
+        self.assertAggregates(self.module, 2, 4, {1: 1, 2: 0, 3: 1, 4: 0, 5: 0})
+        self.assertAggregates(self.course, 2, 4, {1: 1, 2: 0, 3: 1, 4: 0, 5: 0})
+
+        first.delete()
+        self.assertAggregates(self.module, 1, 3, {1: 0, 2: 0, 3: 1, 4: 0, 5: 0})
+        self.assertAggregates(self.course, 1, 3, {1: 0, 2: 0, 3: 1, 4: 0, 5: 0})
+
+    def test_moving_a_review_moves_its_rating(self):
+        review = self.review(4)
+
+        review.module = self.other_module
+        review.save()
+
+        self.assertAggregates(self.module, 0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+        self.assertAggregates(self.other_module, 1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+        self.assertAggregates(self.course, 1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+
+    def test_backfill_recomputes_counters_from_existing_reviews(self):
+        # bulk_create sends no signals, like rows that predate the counters.
+        Review.objects.bulk_create([
+            Review(user=self.user, module=self.module, rating=5, review='Review'),
+            Review(user=self.user, module=self.module, rating=2, review='Review'),
+            Review(user=self.user, module=self.other_module, rating=4, review='Review'),
+        ])
+        self.assertAggregates(self.course, 0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+
+        out = io.StringIO()
+        call_command('backfill_ratings', batch_size=1, stdout=out)
+
+        self.assertIn('Updated 2 modules and 1 courses.', out.getvalue())
+        self.assertAggregates(self.module, 2, 7, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+        self.assertAggregates(self.other_module, 1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+        self.assertAggregates(self.course, 3, 11, {1: 0, 2: 1, 3: 0, 4: 1, 5: 1})
+
+        call_command('backfill_ratings', stdout=out)
+        self.assertIn('Updated 0 modules and 0 courses.', out.getvalue())
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password')
+        course = Course.objects.create(
+            user=self.user, course_title='Course', banner_image='banner.png',
+            modules=0, class_per_modules=1)
+        module = Module.objects.create(
+            course=course, title='Module', thumnail='thumb.png')
+        self.reviews = [Review.objects.create(
+            user=self.user, module=module, rating=5, review=f'Review {index}')
+            for index in range(5)]
+        self.url = reverse('review-list')
+
+    def get_page(self, cursor=None):
+        params = {'page_size': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']
+
+    def walk(self):
+        pages, cursor = [], None
+        while True:
+            page = self.get_page(cursor)
+            pages.append(page)
+            cursor = page['next']
+            if cursor is None:
+                return pages
+
+    def expected_ids(self):
+        return [str(pk) for pk in Review.objects.order_by(
+            '-created_on', '-id').values_list('id', flat=True)]
+
+    def test_walks_every_row_once_newest_first(self):
+        pages = self.walk()
+
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertEqual([review['id'] for page in pages for review in page['results']],
+                         self.expected_ids())
+
+    def test_previous_cursor_returns_the_page_before(self):
+        first, second = self.walk()[:2]
+
+        page = self.get_page(second['previous'])
+
+        self.assertEqual(page['results'], first['results'])
+        self.assertIsNone(page['previous'])
+
+    def test_rows_sharing_a_timestamp_are_ordered_by_id(self):
+        Review.objects.update(created_on=timezone.now())
+
+        pages = self.walk()
+
+        self.assertEqual([review['id'] for page in pages for review in page['results']],
+                         self.expected_ids())
+
+    def test_bad_cursor_returns_400(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+
+class CourseSearchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('course-list')
+
+    def create_course(self, title, detail='', level='STANDARD'):
+        return Course.objects.create(
+            user=self.user, course_title=title, detail=detail, level=level,
+            banner_image='banner.png', modules=0, class_per_modules=1)
+
+    def search(self, query, **filters):
+        return search_courses(Course.objects.filter(**filters), query, limit=10)
+
+    def test_terms_match_as_prefixes_and_title_outranks_detail(self):
+        in_detail = self.create_course('Cooking', detail='Python for chefs')
+        in_title = self.create_course('Python basics')
+        self.create_course('Gardening')
+
+        self.assertEqual(self.search('pyth'), [in_title, in_detail])
+
+    def test_filters_apply_before_the_limit(self):
+        for index in range(15):
+            self.create_course(f'Python {index}', level='BASIC')
+        advanced = self.create_course('Cooking', detail='python', level='ADVANCE')
+
+        self.assertEqual(self.search('python', level='ADVANCE'), [advanced])
+
+    def test_deleted_and_renamed_courses_leave_the_index(self):
+        renamed = self.create_course('Python basics')
+        self.create_course('Python advanced').delete()
+        renamed.course_title = 'Gardening'
+        renamed.save()
+
+        self.assertEqual(self.search('python'), [])
+        self.assertEqual(self.search('garden'), [renamed])
+
+    def test_query_without_terms_lists_courses(self):
+        self.create_course('Python basics')
+
+        response = self.client.get(self.url, {'q': '*'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']['results']), 1)
+
+    def test_search_endpoint_returns_matches(self):
+        course = self.create_course('Python basics')
+        self.create_course('Gardening')
+
+        response = self.client.get(self.url, {'q': 'python'})
+
+        self.assertEqual([row['id'] for row in response.data['data']['results']],
+                         [str(course.id)])
+
+    @skipUnless(connection.vendor == 'postgresql', "Trigram similarity needs PostgreSQL")
+    def test_misspelt_title_falls_back_to_trigram_similarity(self):
+        course = self.create_course('Photography')
+
+        self.assertEqual(self.search('fotography'), [course])
+
+
+
+class ExportAPIViewTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True)
+        self.old = self.create_course('Old')
+        Course.objects.filter(pk=self.old.pk).update(
+            updated_on=timezone.now() - timezone.timedelta(days=2))
+        self.new = self.create_course('New')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_course(self, title):
+        return Course.objects.create(
+            user=self.admin, course_title=title, banner_image='banner.png',
+            modules=0, class_per_modules=1)
+
+    def export(self, export_format, **kwargs):
+        url = reverse('export', kwargs={'resource': 'courses', 'export_format': export_format})
+        return self.client.get(url, **kwargs)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_streams_one_object_per_row_oldest_first(self):
+        response = self.export('ndjson', HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['course_title'] for row in rows], ['Old', 'New'])
+
+    def test_csv_streams_a_header_and_rows(self):
+        response = self.export('csv', HTTP_ACCEPT='text/csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        self.assertEqual([row['course_title'] for row in rows], ['Old', 'New'])
+
+    def test_updated_since_filters_rows(self):
+        since = (timezone.now() - timezone.timedelta(days=1)).isoformat()
+
+        response = self.export('ndjson', data={'updated_since': since})
+
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [str(self.new.id)])
+
+    def test_bad_updated_since_returns_400(self):
+        for value in ('yesterday', '2024-13-45T00:00:00'):
+            response = self.export('csv', data={'updated_since': value}, HTTP_ACCEPT='text/csv')
+            self.assertEqual(response.status_code, 400)
+
+    def test_unknown_export_returns_404(self):
+        self.assertEqual(self.export('xml').status_code, 404)
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(CustomUser.objects.create_user(
+            email='student@example.com', password='password'))
+
+        self.assertEqual(self.export('csv').status_code, 403)
+
+
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class ModuleIngestSerializerTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='teacher@example.com', password='password')
+        self.course = Course.objects.create(
+            user=self.user, course_title='Course', banner_image='banner.png',
+            modules=0, class_per_modules=1)
+
+    def build_payload(self, count):
+        return [{
+            'course': str(self.course.id),
+            'title': f'Module {index}',
+            'thumnail': make_image(),
+            'videos': [{'title': 'Video', 'video_url': 'https://example.com/v', 'thumnail': make_image()}],
+            'attachments': [{'title': 'Attachment'}],
+        } for index in range(count)]
+
+    def ingest(self, count):
+        serializer = ModuleIngestSerializer(
+            data=self.build_payload(count), many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertNumQueries(5) as context:
+            serializer.save()
+        return context
+
+    def test_round_trips_are_independent_of_payload_size(self):
+        # SAVEPOINT, three bulk INSERTs, RELEASE SAVEPOINT.
+        self.ingest(1)
+        self.ingest(40)
+        self.assertEqual(Module.objects.count(), 41)
+        self.assertEqual(Video.objects.count(), 41)
+        self.assertEqual(Attachment.objects.count(), 41)
+
+    def test_invalid_item_rejects_whole_payload(self):
+        payload = self.build_payload(3)
+        del payload[2]['title']
+        serializer = ModuleIngestSerializer(data=payload, many=True)
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(Module.objects.count(), 0)
@@ -10,23 +10,28 @@ from .views import (
     ModuleAPIView,
     AssignmentCreateAPIView,
     CourseAPIView,
-    CourseListAPIView
+    CourseListAPIView,
+    CourseTreeAPIView,
+    ExportAPIView
 )
 
 urlpatterns = [
     path('reviews/', ReviewView.as_view(), name='review-list'),
     path('reviews/<uuid:id>/', ReviewDetailView.as_view(), name='review-detail'),
     path('courses/', CourseCreateView.as_view(), name='course-create'),
-    path('courses/<int:pk>/', CourseAPIView.as_view(), name='course-detail'),
+    path('courses/<uuid:pk>/', CourseAPIView.as_view(), name='course-detail'),
+    path('courses/<uuid:pk>/tree/', CourseTreeAPIView.as_view(), name='course-tree'),
     path('courses/list/', CourseListAPIView.as_view(), name='course-list'),
     path('modules/', ModuleCreateView.as_view(), name='module-create'),
-    path('modules/<int:pk>/', ModuleAPIView.as_view(), name='module-detail'),
+    path('modules/<uuid:pk>/', ModuleAPIView.as_view(), name='module-detail'),
     path('assignments/', AssignmentCreateAPIView.as_view(),
          name='assignment-create'),
-    path('assignments/<int:pk>/', AssignmentAPIView.as_view(),
+    path('assignments/<uuid:pk>/', AssignmentAPIView.as_view(),
          name='assignment-detail'),
-    path('assignments/module/<int:pk>/',
+    path('assignments/module/<uuid:pk>/',
          AssignmentListAPIView.as_view(), name='assignment-list'),
     path('answers/', AssignmentAnswerCreateAPIView.as_view(),
          name='assignment-answer-create'),
+    path('exports/<str:resource>.<str:export_format>', ExportAPIView.as_view(),
+         name='export'),
 ]
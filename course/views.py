@@ -1,14 +1,23 @@
 import logging
-from django.db.models import Q
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework.views import APIView
 from rest_framework import status
 from drf_yasg import openapi
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from exceptions.custom_apiexception_class import CustomAPIException
-from utils import custom_response
+from utils.custom_response import custom_response
+from subscription.permissions import HasActiveSubscription
+from utils.custom_pagination import CursorPagination
+from utils.conditional import get_not_modified_response, get_page_validators, get_version_validators, set_validators
+from .cache import get_cached_detail, get_last_modified, get_version, get_written_on
+from .exports import EXPORT_RESOURCES, ExportContentNegotiation, get_export_rows, stream_csv, stream_ndjson
+from .search import get_search_terms, search_courses
 from .models import AssignmentAnswer, Course, Review, Module, Video, Assignment, Attachment
-from .serializers import AssignmentAnswerSerializer, AssignmentSerializer, AttachmentSerializer, CourseSerializer, ModuleSerializer, ReviewSerializer, VideoSerializer
+from .serializers import AssignmentAnswerSerializer, AssignmentSerializer, AttachmentSerializer, CourseSerializer, ModuleIngestSerializer, ModuleSerializer, ModuleTreeSerializer, ReviewSerializer, VideoSerializer
 from rest_framework.response import Response
 logger = logging.getLogger(__name__)
 
@@ -18,9 +27,13 @@ class ReviewView(APIView):
 
     def get(self, request, *args, **kwargs):
         try:
-            reviews = Review.objects.all()
+            paginator = CursorPagination()
+            reviews = paginator.paginate_queryset(
+                Review.objects.all(), request, view=self)
             serializer = ReviewSerializer(reviews, many=True)
-            return custom_response(status_code=status.HTTP_200_OK, message="Success", data=serializer.data)
+            return paginator.get_paginated_response(serializer.data)
+        except CustomAPIException as e:
+            return custom_response(status_code=e.status_code, message=e.detail)
         except Exception as e:
             raise CustomAPIException(detail=str(
                 e), status_code=status.HTTP_400_BAD_REQUEST).get_full_details()
@@ -76,11 +89,15 @@ class CourseCreateView(APIView):
 
 
 class CourseAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, HasActiveSubscription]
+    subscription_course_lookup = 'pk'
 
     def get(self, request, pk, format=None):
         try:
-            course = Course.objects.get(id=pk)
+            # A cached payload proves the course exists, so unknown ids
+            # still 404 rather than matching an ETag.
+            response_data, version, last_modified = get_cached_detail(
+                'course', pk, lambda: self.get_response_data(pk))
         except Course.DoesNotExist:
             error_msg = f"Course with id {pk} not found."
             logger.error(error_msg)
@@ -90,21 +107,27 @@ class CourseAPIView(APIView):
             logger.error(error_msg)
             return CustomAPIException(detail=error_msg, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR).get_full_details()
 
-        try:
-            modules = Module.objects.filter(course=course)
-            course_data = CourseSerializer(course).data
-            modules_data = ModuleSerializer(modules, many=True).data
-        except Exception as e:
-            error_msg = f"An error occurred while retrieving the modules: {str(e)}"
-            logger.error(error_msg)
-            return CustomAPIException(detail=error_msg, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR).get_full_details()
-
-        response_data = {
-            'course': course_data,
-            'modules': modules_data
-        }
-
-        return custom_response(status_code=status.HTTP_200_OK, message="Course and modules fetched successfully", data=response_data)
+        etag, last_modified = get_version_validators(
+            'course', pk, version, last_modified=last_modified)
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = custom_response(status_code=status.HTTP_200_OK, message="Course and modules fetched successfully", data=response_data)
+        return set_validators(response, etag, last_modified)
+
+    def get_response_data(self, pk):
+        course = Course.objects.get(id=pk)
+        modules = list(Module.objects.filter(
+            course=course).prefetch_related('videos', 'attachments'))
+        rows = [course, *modules]
+        for module in modules:
+            rows.extend(module.videos.all())
+            rows.extend(module.attachments.all())
+        return {
+            'course': CourseSerializer(course).data,
+            'modules': ModuleSerializer(modules, many=True).data
+        }, get_last_modified(*(row.updated_on for row in rows))
 
     @swagger_auto_schema(request_body=CourseSerializer)
     def patch(self, request, pk, format=None):
@@ -138,14 +161,68 @@ class CourseAPIView(APIView):
             return custom_response(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, message="An unexpected error occurred", data=str(e))
 
 
+def get_course_tree_queryset(user):
+    """
+    Course -> modules -> videos/attachments/assignments -> the caller's
+    answers, loaded with one query per level however many modules there are.
+    """
+    answers = AssignmentAnswer.objects.filter(user=user)
+    assignments = Assignment.objects.prefetch_related(
+        Prefetch('answers', queryset=answers, to_attr='user_answers'))
+    modules = Module.objects.prefetch_related(
+        'videos', 'attachments', Prefetch('assignments', queryset=assignments))
+    return Course.objects.prefetch_related(Prefetch('module_set', queryset=modules))
+
+
+class CourseTreeAPIView(APIView):
+    permission_classes = [IsAuthenticated, HasActiveSubscription]
+    subscription_course_lookup = 'pk'
+
+    def get(self, request, pk, format=None):
+        try:
+            # Versions are read before the rows, so a concurrent write can
+            # only leave the response tagged as older than it is.
+            etag, last_modified = get_version_validators(
+                'tree', pk, get_version('course', pk),
+                get_version('answers', request.user.pk), request.user.pk,
+                last_modified=get_written_on(('course', pk), ('answers', request.user.pk)))
+            if not Course.objects.filter(id=pk).exists():
+                raise Course.DoesNotExist
+            not_modified = get_not_modified_response(
+                request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            course = get_course_tree_queryset(request.user).get(id=pk)
+        except Course.DoesNotExist:
+            error_msg = f"Course with id {pk} not found."
+            logger.error(error_msg)
+            return CustomAPIException(detail=error_msg, status_code=status.HTTP_404_NOT_FOUND).get_full_details()
+        except Exception as e:
+            error_msg = f"An error occurred while retrieving the course: {str(e)}"
+            logger.error(error_msg)
+            return CustomAPIException(detail=error_msg, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR).get_full_details()
+
+        response_data = {
+            'course': CourseSerializer(course).data,
+            'modules': ModuleTreeSerializer(course.module_set.all(), many=True).data
+        }
+
+        response = custom_response(status_code=status.HTTP_200_OK, message="Course tree fetched successfully", data=response_data)
+        return set_validators(response, etag, last_modified)
+
+
 class CourseListAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, format=None):
         try:
+            query = request.query_params.get('q', None)
             level = request.query_params.get('level', None)
             detail = request.query_params.get('detail', None)
             course_title = request.query_params.get('course_title', None)
+            min_rating = request.query_params.get('min_rating', None)
+            ordering = request.query_params.get('ordering', None)
 
             filters = Q()
             if level:
@@ -154,14 +231,39 @@ class CourseListAPIView(APIView):
                 filters &= Q(detail__icontains=detail)
             if course_title:
                 filters &= Q(course_title__icontains=course_title)
-
-            courses = Course.objects.filter(filters)
-            if not courses.exists():
+            if min_rating:
+                try:
+                    filters &= Q(rating_average__gte=float(min_rating))
+                except ValueError:
+                    raise CustomAPIException(
+                        detail="min_rating must be a number.", status_code=status.HTTP_400_BAD_REQUEST)
+
+            paginator = CursorPagination(
+                ordering_field='rating_average' if ordering == 'rating' else None)
+            if get_search_terms(query):
+                # Ranked results are consumed from the top, so search returns
+                # a single page of the best matches rather than a cursor.
+                courses = search_courses(Course.objects.filter(
+                    filters), query, limit=paginator.get_page_size(request))
+                paginator.next_cursor = paginator.previous_cursor = None
+            else:
+                courses = paginator.paginate_queryset(
+                    Course.objects.filter(filters), request, view=self)
+            if not courses and not request.query_params.get(paginator.cursor_query_param):
                 raise CustomAPIException(
-                    detail="No courses found", status_code=status.HTTP_404_NOT_FOUND).get_full_details()
+                    detail="No courses found", status_code=status.HTTP_404_NOT_FOUND)
+
+            etag, last_modified = get_page_validators(
+                courses, request.get_full_path())
+            not_modified = get_not_modified_response(
+                request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
 
             serializer = CourseSerializer(courses, many=True)
-            return custom_response(status_code=status.HTTP_200_OK, message="Courses retrieved successfully", data=serializer.data)
+            response = paginator.get_paginated_response(
+                serializer.data, message="Courses retrieved successfully")
+            return set_validators(response, etag, last_modified)
 
         except CustomAPIException as e:
             return custom_response(status_code=e.status_code, message=e.detail)
@@ -173,49 +275,34 @@ class ModuleCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
-        request_body=ModuleSerializer(many=True),
+        request_body=ModuleIngestSerializer(many=True),
         responses={status.HTTP_201_CREATED: ModuleSerializer(many=True)}
     )
     def post(self, request, *args, **kwargs):
-        module_data_list = request.data
-        created_modules = []
+        serializer = ModuleIngestSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return custom_response(status_code=status.HTTP_400_BAD_REQUEST, message="Invalid data", data=serializer.errors)
 
         try:
-            for module_data in module_data_list:
-                serializer = ModuleSerializer(data=module_data)
-                if serializer.is_valid():
-                    # Create the Module instance
-                    module = Module.objects.create(**serializer.validated_data)
-                    created_modules.append(module)
-
-                    # Create Video instances
-                    videos_data = module_data.get('videos', [])
-                    for video_data in videos_data:
-                        Video.objects.create(module=module, **video_data)
-
-                    # Create Attachment instances
-                    attachments_data = module_data.get('attachments', [])
-                    for attachment_data in attachments_data:
-                        Attachment.objects.create(
-                            module=module, **attachment_data)
-                else:
-                    raise CustomAPIException(detail=str(
-                        serializer.errors), status_code=status.HTTP_400_BAD_REQUEST).get_full_details()
-
-            # Serialize the created modules and return the response
-            response_data = ModuleSerializer(created_modules, many=True).data
-            return custom_response(
-                status_code=status.HTTP_201_CREATED,
-                message="Modules created successfully",
-                data=response_data
-            )
+            created_modules = serializer.save()
+            modules = Module.objects.filter(
+                id__in=[module.id for module in created_modules]).prefetch_related('videos', 'attachments')
+            response_data = ModuleSerializer(modules, many=True).data
         except Exception as e:
-            raise CustomAPIException(detail=str(
-                e), status_code=status.HTTP_400_BAD_REQUEST).get_full_details()
+            error_msg = f"An error occurred while creating the modules: {str(e)}"
+            logger.error(error_msg)
+            return CustomAPIException(detail=error_msg, status_code=status.HTTP_400_BAD_REQUEST).get_full_details()
+
+        return custom_response(
+            status_code=status.HTTP_201_CREATED,
+            message="Modules created successfully",
+            data=response_data
+        )
 
 
 class ModuleAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, HasActiveSubscription]
+    subscription_course_lookup = 'module'
 
     @swagger_auto_schema(request_body=ModuleSerializer)
     def patch(self, request, pk, format=None):
@@ -268,7 +355,8 @@ class ModuleAPIView(APIView):
 
     def get(self, request, pk, format=None):
         try:
-            module = Module.objects.get(id=pk)
+            response_data, version, last_modified = get_cached_detail(
+                'module', pk, lambda: self.get_response_data(pk))
         except Module.DoesNotExist:
             error_msg = f"Module with id {pk} not found."
             logger.error(error_msg)
@@ -278,30 +366,25 @@ class ModuleAPIView(APIView):
             logger.error(error_msg)
             return CustomAPIException(detail=error_msg, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR).get_full_details()
 
-        try:
-            videos = Video.objects.filter(module=module)
-            attachments = Attachment.objects.filter(module=module)
-            assignments = Assignment.objects.filter(module=module)
-
-            module_data = ModuleSerializer(module).data
-            videos_data = VideoSerializer(videos, many=True).data
-            attachments_data = AttachmentSerializer(
-                attachments, many=True).data
-            assignments_data = AssignmentSerializer(
-                assignments, many=True).data
-        except Exception as e:
-            error_msg = f"An error occurred while retrieving the related data: {str(e)}"
-            logger.error(error_msg)
-            return CustomAPIException(detail=error_msg, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR).get_full_details()
+        etag, last_modified = get_version_validators(
+            'module', pk, version, last_modified=last_modified)
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
 
-        response_data = {
-            'module': module_data,
-            'videos': videos_data,
-            'attachments': attachments_data,
-            'assignments': assignments_data
-        }
+        response = custom_response(status_code=status.HTTP_200_OK, message="Module and related data fetched successfully", data=response_data)
+        return set_validators(response, etag, last_modified)
 
-        return custom_response(status_code=status.HTTP_200_OK, message="Module and related data fetched successfully", data=response_data)
+    def get_response_data(self, pk):
+        module = Module.objects.prefetch_related(
+            'videos', 'attachments', 'assignments').get(id=pk)
+        rows = [module, *module.videos.all(), *module.attachments.all(), *module.assignments.all()]
+        return {
+            'module': ModuleSerializer(module).data,
+            'videos': VideoSerializer(module.videos.all(), many=True).data,
+            'attachments': AttachmentSerializer(module.attachments.all(), many=True).data,
+            'assignments': AssignmentSerializer(module.assignments.all(), many=True).data
+        }, get_last_modified(*(row.updated_on for row in rows))
 
 
 class AssignmentCreateAPIView(APIView):
@@ -323,11 +406,22 @@ class AssignmentCreateAPIView(APIView):
 
 
 class AssignmentAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, HasActiveSubscription]
+    subscription_course_lookup = 'module__assignments'
 
     def get(self, request, pk, format=None):
         try:
+            answers_version = get_version('answers', request.user.pk)
             assignment = Assignment.objects.get(pk=pk)
+            etag, last_modified = get_version_validators(
+                'assignment', pk, assignment.updated_on.isoformat(), answers_version, request.user.pk,
+                last_modified=get_last_modified(
+                    assignment.updated_on, get_written_on(('answers', request.user.pk))))
+            not_modified = get_not_modified_response(
+                request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
             serializer = AssignmentSerializer(assignment)
             user = request.user
             assignment_answer = AssignmentAnswer.objects.filter(
@@ -344,7 +438,8 @@ class AssignmentAPIView(APIView):
                     'assignment': serializer.data,
                     'assignment_answer': None
                 }
-            return custom_response(status_code=status.HTTP_200_OK, message="Assignment details retrieved", data=response_data)
+            response = custom_response(status_code=status.HTTP_200_OK, message="Assignment details retrieved", data=response_data)
+            return set_validators(response, etag, last_modified)
         except Assignment.DoesNotExist:
             raise CustomAPIException(
                 detail="Assignment not found", status_code=status.HTTP_404_NOT_FOUND).get_full_details()
@@ -406,17 +501,68 @@ class AssignmentAnswerCreateAPIView(APIView):
 
 
 class AssignmentListAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, HasActiveSubscription]
+    subscription_course_lookup = 'module'
 
     def get(self, request, pk, format=None):
         try:
-            assignments = Assignment.objects.filter(module_id=pk)
-            if not assignments.exists():
+            assignments = list(Assignment.objects.filter(module_id=pk))
+            if not assignments:
                 raise CustomAPIException(
-                    detail="No assignments found for this module", status_code=status.HTTP_404_NOT_FOUND).get_full_details()
+                    detail="No assignments found for this module", status_code=status.HTTP_404_NOT_FOUND)
+
+            etag, last_modified = get_page_validators(assignments)
+            not_modified = get_not_modified_response(
+                request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
             serializer = AssignmentSerializer(assignments, many=True)
-            return custom_response(status_code=status.HTTP_200_OK, message="Assignments retrieved successfully", data=serializer.data)
+            response = custom_response(status_code=status.HTTP_200_OK, message="Assignments retrieved successfully", data=serializer.data)
+            return set_validators(response, etag, last_modified)
         except CustomAPIException as e:
             return custom_response(status_code=e.status_code, message=e.detail)
         except Exception as e:
             return custom_response(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, message="An unexpected error occurred", data=str(e))
+
+
+class ExportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    content_negotiation_class = ExportContentNegotiation
+    content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'updated_since', openapi.IN_QUERY, description="Only export rows updated at or after this ISO 8601 timestamp", type=openapi.TYPE_STRING, required=False
+            )
+        ],
+        responses={200: "Streamed export", 400: "Bad request", 404: "Not found"}
+    )
+    def get(self, request, resource, export_format, format=None):
+        if resource not in EXPORT_RESOURCES or export_format not in self.content_types:
+            return CustomAPIException(
+                detail=f"Unknown export {resource}.{export_format}", status_code=status.HTTP_404_NOT_FOUND).get_full_details()
+
+        updated_since = request.query_params.get('updated_since', None)
+        if updated_since:
+            try:
+                updated_since = parse_datetime(updated_since)
+            except ValueError:
+                # Well formed but out of range, e.g. month 13.
+                updated_since = None
+            if updated_since is None:
+                return CustomAPIException(
+                    detail="updated_since must be an ISO 8601 datetime.", status_code=status.HTTP_400_BAD_REQUEST).get_full_details()
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since)
+
+        fields, rows = get_export_rows(resource, updated_since)
+        stream = stream_ndjson if export_format == 'ndjson' else stream_csv
+        response = StreamingHttpResponse(
+            stream(fields, rows), content_type=self.content_types[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{export_format}"'
+        return response
@@ -0,0 +1,21 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+@admin.action(description="Requeue selected emails")
+def requeue(modeladmin, request, queryset):
+    queryset.update(status=OutboxEmail.PENDING, attempts=0,
+                    available_on=timezone.now())
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'attempts',
+                    'available_on', 'created_on', 'sent_on']
+    list_filter = ['status']
+    search_fields = ['subject', 'last_error']
+    actions = [requeue]
+
+
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
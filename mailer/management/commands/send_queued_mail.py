@@ -0,0 +1,114 @@
+import logging
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from mailer.models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+UPDATE_FIELDS = ['status', 'attempts', 'last_error', 'available_on', 'sent_on']
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails over one persistent SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the outbox and exit instead of polling (for cron).")
+        parser.add_argument('--interval', type=float, default=5,
+                            help="Seconds to wait between polls when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        connection = get_connection()
+        sent = failed = 0
+        try:
+            while True:
+                batch_sent, batch_failed, claimed = self.send_batch(
+                    connection, batch_size)
+                sent += batch_sent
+                failed += batch_failed
+                if claimed < batch_size:
+                    # Don't hold an idle SMTP session open between polls.
+                    connection.close()
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        finally:
+            connection.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {sent} emails, {failed} delivery attempts failed."))
+
+    def send_batch(self, connection, batch_size):
+        sent = failed = 0
+        emails = self.claim_batch(batch_size)
+        # Sent outside the claiming transaction, so no row lock or
+        # transaction is held open across SMTP round trips.
+        for email in emails:
+            try:
+                self.deliver(connection, email)
+            except Exception as e:
+                self.record_failure(email, e)
+                failed += 1
+            else:
+                email.status = OutboxEmail.SENT
+                email.sent_on = timezone.now()
+                email.last_error = ''
+                sent += 1
+        OutboxEmail.objects.bulk_update(emails, UPDATE_FIELDS)
+        return sent, failed, len(emails)
+
+    def claim_batch(self, batch_size):
+        now = timezone.now()
+        with transaction.atomic():
+            # Other workers skip the locked rows instead of waiting, and see
+            # them as claimed once this commits.
+            emails = list(
+                OutboxEmail.objects.select_for_update(skip_locked=True)
+                .filter(status__in=[OutboxEmail.PENDING, OutboxEmail.SENDING],
+                        available_on__lte=now)
+                .order_by('available_on')[:batch_size])
+            for email in emails:
+                email.status = OutboxEmail.SENDING
+                email.attempts += 1
+                email.available_on = now + timedelta(seconds=settings.MAIL_SEND_LEASE)
+            OutboxEmail.objects.bulk_update(emails, ['status', 'attempts', 'available_on'])
+        return emails
+
+    def deliver(self, connection, email):
+        message = EmailMultiAlternatives(
+            subject=email.subject, body=email.body, from_email=email.from_email,
+            to=email.to, connection=connection)
+        if email.html_body:
+            message.attach_alternative(email.html_body, "text/html")
+        try:
+            # A no-op once connected. Opening it here rather than letting
+            # send_messages() do it keeps the session open across messages.
+            connection.open()
+            connection.send_messages([message])
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the persistent session; reconnect once.
+            connection.close()
+            connection.open()
+            connection.send_messages([message])
+
+    def record_failure(self, email, error):
+        email.last_error = str(error)
+        if email.attempts >= settings.MAIL_MAX_ATTEMPTS:
+            email.status = OutboxEmail.FAILED
+            logger.error(
+                f"Giving up on email {email.id} after {email.attempts} attempts: {error}")
+            return
+        email.status = OutboxEmail.PENDING
+        email.available_on = timezone.now() + timedelta(
+            seconds=settings.MAIL_RETRY_BACKOFF * 2 ** (email.attempts - 1))
+        logger.warning(
+            f"Email {email.id} failed (attempt {email.attempts}), will retry: {error}")
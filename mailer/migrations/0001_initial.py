@@ -0,0 +1,65 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:30
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxEmail",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        db_index=True,
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                        unique=True,
+                    ),
+                ),
+                ("subject", models.CharField(max_length=255)),
+                ("from_email", models.CharField(max_length=255)),
+                ("to", models.JSONField(default=list)),
+                ("body", models.TextField(blank=True)),
+                ("html_body", models.TextField(blank=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("sent", "Sent"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                (
+                    "available_on",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("created_on", models.DateTimeField(auto_now_add=True)),
+                ("sent_on", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ("created_on",),
+                "indexes": [
+                    models.Index(
+                        fields=["status", "available_on"],
+                        name="outbox_status_available_idx",
+                    )
+                ],
+            },
+        ),
+    ]
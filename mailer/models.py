@@ -0,0 +1,47 @@
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxEmail(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        # Claimed by a worker until available_on; reclaimed after that if
+        # the worker died mid-send.
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        # Dead letters: gave up after MAIL_MAX_ATTEMPTS.
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(
+        primary_key=True, default=uuid.uuid4, editable=False, unique=True, db_index=True)
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Earliest time the next delivery attempt may run (retry backoff, or
+    # the end of a worker's claim on a sending row).
+    available_on = models.DateTimeField(default=timezone.now)
+    created_on = models.DateTimeField(auto_now_add=True)
+    sent_on = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('created_on',)
+        indexes = [
+            models.Index(fields=['status', 'available_on'],
+                         name='outbox_status_available_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
@@ -0,0 +1,36 @@
+from django.conf import settings
+
+from .models import OutboxEmail
+from .rendering import render_emails
+
+
+def queue_email(subject, to, html_body='', body=' ', from_email=None):
+    """
+    Add an email to the outbox and return it.
+
+    The row is written in the caller's transaction, so the email is only
+    sent if that transaction commits. Delivery happens in the
+    ``send_queued_mail`` worker, never in the request.
+    """
+    return OutboxEmail.objects.create(
+        subject=subject,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or '',
+        to=list(to),
+        body=body,
+        html_body=html_body,
+    )
+
+
+def queue_template_emails(subject, template_name, recipients, from_email=None):
+    """
+    Render ``template_name`` for each ``(address, merge_data)`` pair in
+    ``recipients`` and add the emails to the outbox in one query.
+    """
+    recipients = list(recipients)
+    html_bodies = render_emails(
+        template_name, [merge_data for _address, merge_data in recipients])
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL or ''
+    return OutboxEmail.objects.bulk_create(
+        OutboxEmail(subject=subject, from_email=from_email, to=[address],
+                    body=' ', html_body=html_body)
+        for (address, _merge_data), html_body in zip(recipients, html_bodies))
@@ -0,0 +1,115 @@
+import re
+from functools import lru_cache
+
+from django.template.base import TextNode, Variable, VariableNode
+from django.template.defaulttags import CommentNode, LoadNode
+from django.template.loader import get_template
+from django.template.loader_tags import BlockNode, ExtendsNode
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+
+# Stands in for a merge variable when a shell is rendered. The separator
+# is a control character, so it survives HTML escaping untouched and never
+# occurs in real template output.
+MARKER = '\x1f{}\x1f'
+MARKER_RE = re.compile('\x1f([^\x1f]*)\x1f')
+
+# Nodes whose output never depends on the value of a merge variable.
+STATIC_NODES = (TextNode, BlockNode, CommentNode, LoadNode)
+
+
+def is_substitutable(nodelist):
+    """
+    Return whether every variable in ``nodelist`` is output as it is, so a
+    shell rendered from it is right for any values. Other tags, filters
+    and attribute lookups can all make the output depend on the value.
+    """
+    for node in nodelist:
+        if isinstance(node, VariableNode):
+            expression = node.filter_expression
+            if expression.filters or (
+                    isinstance(expression.var, Variable) and len(expression.var.lookups or ()) > 1):
+                return False
+        elif isinstance(node, ExtendsNode):
+            parent = node.parent_name.var
+            if not isinstance(parent, str) or not is_substitutable(
+                    get_template(parent).template.nodelist):
+                return False
+        elif not isinstance(node, STATIC_NODES):
+            return False
+        for attr in node.child_nodelists:
+            if not is_substitutable(getattr(node, attr, None) or ()):
+                return False
+    return True
+
+
+class EmailTemplate:
+    """
+    A compiled email template that renders recipients by substitution.
+
+    The template is rendered once per set of merge variables with a marker
+    in place of each variable, leaving a shell of static HTML with holes.
+    Rendering a recipient then only escapes their values into the holes.
+
+    Only templates made of text, plain variables and ``extends``,
+    ``block``, ``load`` and ``comment`` tags get a shell; anything that can
+    branch on, loop over or filter a value is always rendered in full. The
+    first recipient for each set of variables is also rendered in full and
+    compared with the shell's output.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.template = get_template(name)
+        self.substitutable = is_substitutable(self.template.template.nodelist)
+        self.shells = {}
+
+    def render(self, context):
+        if not self.substitutable:
+            return self.template.render(context)
+        keys = frozenset(context)
+        try:
+            shell = self.shells[keys]
+        except KeyError:
+            return self.build_shell(keys, context)
+        if shell is None:
+            return self.template.render(context)
+        return self.fill(shell, context)
+
+    def render_many(self, contexts):
+        return [self.render(context) for context in contexts]
+
+    def build_shell(self, keys, context):
+        rendered = self.template.render(context)
+        shell = MARKER_RE.split(
+            self.template.render({key: MARKER.format(key) for key in keys}))
+        # A filter may have rewritten a marker into a name we don't know.
+        usable = keys.issuperset(shell[1::2]) and self.fill(shell, context) == rendered
+        self.shells[keys] = shell if usable else None
+        return rendered
+
+    def fill(self, shell, context):
+        # split() leaves static HTML at even indexes and variable names at
+        # odd ones.
+        parts = shell[:]
+        for index in range(1, len(parts), 2):
+            parts[index] = conditional_escape(localize(context[parts[index]]))
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=None)
+def get_email_template(name):
+    return EmailTemplate(name)
+
+
+def render_email(template_name, context):
+    """Render one email template with a dict of merge data."""
+    return get_email_template(template_name).render(context)
+
+
+def render_emails(template_name, contexts):
+    """
+    Render one email template for each dict of merge data in ``contexts``,
+    returning the HTML bodies in the same order.
+    """
+    return get_email_template(template_name).render_many(contexts)
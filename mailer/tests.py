@@ -0,0 +1,133 @@
+import smtplib
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .models import OutboxEmail
+from .outbox import queue_email
+from .rendering import get_email_template, render_emails
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPRecipientsRefused({})
+
+
+class ClaimCheckingBackend(BaseEmailBackend):
+    """Record each email's outbox row as other workers see it mid-send."""
+    seen = []
+
+    def send_messages(self, email_messages):
+        self.seen.extend(OutboxEmail.objects.values_list('status', 'attempts'))
+        return len(email_messages)
+
+
+class SendQueuedMailTests(TestCase):
+    def send_queued_mail(self):
+        call_command('send_queued_mail', '--once', stdout=StringIO())
+
+    def test_queued_email_is_sent_by_worker(self):
+        queue_email("Subject", ['student@example.com'], html_body='<p>Hi</p>')
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.send_queued_mail()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives,
+                         [('<p>Hi</p>', 'text/html')])
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.SENT)
+        self.assertIsNotNone(email.sent_on)
+
+    @override_settings(EMAIL_BACKEND='mailer.tests.FailingBackend', MAIL_MAX_ATTEMPTS=2)
+    def test_failed_email_is_retried_then_dead_lettered(self):
+        queue_email("Subject", ['student@example.com'])
+
+        self.send_queued_mail()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts),
+                         (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.available_on, email.created_on)
+
+        OutboxEmail.objects.update(available_on=email.created_on)
+        self.send_queued_mail()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts),
+                         (OutboxEmail.FAILED, 2))
+        self.assertTrue(email.last_error)
+
+    @override_settings(EMAIL_BACKEND='mailer.tests.ClaimCheckingBackend')
+    def test_rows_are_claimed_before_sending(self):
+        ClaimCheckingBackend.seen = []
+        queue_email("Subject", ['student@example.com'])
+
+        self.send_queued_mail()
+
+        self.assertEqual(ClaimCheckingBackend.seen, [(OutboxEmail.SENDING, 1)])
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+
+    def test_claimed_rows_are_reclaimed_after_the_lease(self):
+        email = queue_email("Subject", ['student@example.com'])
+        OutboxEmail.objects.filter(pk=email.pk).update(
+            status=OutboxEmail.SENDING, attempts=1,
+            available_on=timezone.now() + timedelta(minutes=5))
+
+        self.send_queued_mail()
+        self.assertEqual(len(mail.outbox), 0)
+
+        OutboxEmail.objects.filter(pk=email.pk).update(available_on=timezone.now())
+        self.send_queued_mail()
+        email.refresh_from_db()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.SENT, 2))
+
+
+LOCMEM_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', {
+        'upper.html': '<p>{{ name|upper }}</p>',
+        'note.html': '{% if msg %}Note: {{ msg }}{% else %}No note{% endif %}',
+        'default.html': '{{ msg|default:"No note" }}',
+    })]},
+}]
+
+
+class RenderEmailTests(SimpleTestCase):
+    def setUp(self):
+        get_email_template.cache_clear()
+
+    def test_bulk_render_matches_full_render(self):
+        contexts = [
+            {'inshopper_user': 'ada@example.com', 'msg': 'Hi Ada'},
+            {'inshopper_user': '<b>bob</b>', 'msg': 'Tom & Jerry'},
+        ]
+
+        rendered = render_emails('emails/sub_expired.html', contexts)
+
+        self.assertEqual(rendered, [render_to_string('emails/sub_expired.html', context)
+                                    for context in contexts])
+        self.assertIn('&lt;b&gt;bob&lt;/b&gt;', rendered[1])
+        template = get_email_template('emails/sub_expired.html')
+        self.assertIsNotNone(template.shells[frozenset(contexts[0])])
+
+    @override_settings(TEMPLATES=LOCMEM_TEMPLATES)
+    def test_filtered_variable_falls_back_to_full_render(self):
+        rendered = render_emails('upper.html', [{'name': 'ada'}, {'name': 'bob'}])
+
+        self.assertEqual(rendered, ['<p>ADA</p>', '<p>BOB</p>'])
+        self.assertFalse(get_email_template('upper.html').substitutable)
+
+    @override_settings(TEMPLATES=LOCMEM_TEMPLATES)
+    def test_templates_that_depend_on_values_are_rendered_in_full(self):
+        contexts = [{'msg': 'hi'}, {'msg': ''}]
+
+        self.assertEqual(render_emails('note.html', contexts), ['Note: hi', 'No note'])
+        self.assertEqual(render_emails('default.html', contexts), ['hi', 'No note'])
+        self.assertFalse(get_email_template('note.html').substitutable)
+        self.assertFalse(get_email_template('default.html').substitutable)
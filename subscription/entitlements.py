@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Subscription, UserMembership
+
+ENTITLEMENT_KEY = 'entitlement:{user_id}'
+
+# What a user's subscriptions entitle them to: the membership type and
+# expiry date of their longest running active subscription, or Nones.
+Entitlement = namedtuple('Entitlement', ['membership_type', 'expires_in'])
+NO_ENTITLEMENT = Entitlement(None, None)
+
+
+def get_cache():
+    return caches[settings.ENTITLEMENT_CACHE_ALIAS]
+
+
+def load_entitlement(user_id):
+    row = (
+        Subscription.objects.filter(
+            user_membership__user_id=user_id, active=True, expires_in__isnull=False)
+        .order_by('-expires_in')
+        .values_list('user_membership__membership__membership_type', 'expires_in')
+        .first())
+    return Entitlement(*row) if row else NO_ENTITLEMENT
+
+
+def get_entitlement(user_id):
+    """
+    Return the user's Entitlement, from the cache when possible.
+
+    Users without a subscription are cached too, so checking them doesn't
+    hit the database either.
+    """
+    cache = get_cache()
+    key = ENTITLEMENT_KEY.format(user_id=user_id)
+    entitlement = cache.get(key)
+    if entitlement is None:
+        entitlement = load_entitlement(user_id)
+        cache.set(key, tuple(entitlement), settings.ENTITLEMENT_CACHE_TIMEOUT)
+    return Entitlement(*entitlement)
+
+
+def has_active_subscription(user):
+    if not user.is_authenticated:
+        return False
+    # Expiry is checked on read, so cached records need no invalidation when
+    # a subscription runs out, and the expiry sweeper needs no signals.
+    expires_in = get_entitlement(user.pk).expires_in
+    return expires_in is not None and expires_in >= timezone.localdate()
+
+
+def invalidate_entitlement(user_id):
+    if user_id is not None:
+        # Deleting before commit would let a concurrent reader cache the old
+        # rows again.
+        transaction.on_commit(
+            lambda: get_cache().delete(ENTITLEMENT_KEY.format(user_id=user_id)))
+
+
+@receiver(post_save, sender=UserMembership)
+@receiver(post_delete, sender=UserMembership)
+def invalidate_membership_entitlement(sender, instance, *args, **kwargs):
+    invalidate_entitlement(instance.user_id)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_entitlement(sender, instance, *args, **kwargs):
+    user_id = UserMembership.objects.filter(
+        pk=instance.user_membership_id).values_list('user_id', flat=True).first()
+    invalidate_entitlement(user_id)
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from mailer.outbox import queue_template_emails
+from subscription.models import Subscription
+
+
+class Command(BaseCommand):
+    help = "Deactivate expired subscriptions and queue expiry emails (run daily from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Taken once, so a sweep running past midnight has one cut-off.
+        today = timezone.localdate()
+        expired = notified = 0
+        while True:
+            batch_expired, batch_notified = self.expire_batch(today, batch_size)
+            expired += batch_expired
+            notified += batch_notified
+            if batch_expired < batch_size:
+                break
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {expired} subscriptions, queued {notified} emails."))
+
+    def expire_batch(self, today, batch_size):
+        with transaction.atomic():
+            ids = list(
+                Subscription.objects.select_for_update(skip_locked=True)
+                .filter(active=True, expires_in__lt=today)
+                .order_by('expires_in').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return 0, 0
+            Subscription.objects.filter(id__in=ids).update(active=False)
+
+            # Members who have already renewed don't need to hear about it.
+            renewed = Subscription.objects.filter(
+                user_membership=OuterRef('user_membership'),
+                active=True, expires_in__gte=today)
+            emails = (
+                Subscription.objects.filter(id__in=ids).exclude(Exists(renewed))
+                .values_list('user_membership__user__email', flat=True)
+                .order_by().distinct())
+            queued = queue_template_emails(
+                "Subscription Expired!", "emails/sub_expired.html",
+                [(email, self.get_merge_data(email)) for email in emails],
+                from_email=settings.EMAIL_HOST_USER)
+        return len(ids), len(queued)
+
+    def get_merge_data(self, email):
+        return {
+            'inshopper_user': email,
+            'msg': f" Hi {email}, Your subscription just expired. Please renew your subscription to "
+            f"continue enjoying our services."
+        }
@@ -0,0 +1,87 @@
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from subscription.models import PaystackEvent
+from subscription.webhooks import EVENT_HANDLERS
+
+logger = logging.getLogger(__name__)
+
+UPDATE_FIELDS = ['processed_on', 'attempts', 'last_error']
+
+
+class Command(BaseCommand):
+    help = "Apply Paystack webhook events from the inbox in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the inbox and exit instead of polling (for cron).")
+        parser.add_argument('--interval', type=float, default=2,
+                            help="Seconds to wait between polls when the inbox is empty.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        processed = failed = 0
+        while True:
+            batch_processed, batch_failed, claimed = self.process_batch(batch_size)
+            processed += batch_processed
+            failed += batch_failed
+            if claimed < batch_size:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} events, {failed} failed."))
+
+    def process_batch(self, batch_size):
+        with transaction.atomic():
+            events = list(
+                PaystackEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_on__isnull=True,
+                        attempts__lt=settings.PAYSTACK_EVENT_MAX_ATTEMPTS)
+                .order_by('received_on')[:batch_size])
+            groups = defaultdict(list)
+            for event in events:
+                event.attempts += 1
+                groups[event.event].append(event)
+            for name, group in groups.items():
+                handler = EVENT_HANDLERS.get(name)
+                if handler is not None:
+                    self.apply(handler, group)
+                else:
+                    # Nothing to do for this event type, but keep the row.
+                    self.mark_processed(group)
+            PaystackEvent.objects.bulk_update(events, UPDATE_FIELDS)
+        failed = sum(event.processed_on is None for event in events)
+        return len(events) - failed, failed, len(events)
+
+    def apply(self, handler, events):
+        try:
+            with transaction.atomic():
+                handler(events)
+        except Exception as e:
+            if len(events) == 1:
+                self.record_failure(events[0], e)
+                return
+            # Retry one by one so a single bad event doesn't hold up the rest.
+            for event in events:
+                self.apply(handler, [event])
+        else:
+            self.mark_processed(events)
+
+    def mark_processed(self, events):
+        now = timezone.now()
+        for event in events:
+            event.processed_on = now
+            event.last_error = ''
+
+    def record_failure(self, event, error):
+        event.last_error = str(error)
+        log = logger.error if event.attempts >= settings.PAYSTACK_EVENT_MAX_ATTEMPTS else logger.warning
+        log(f"Paystack event {event.event_id} failed (attempt {event.attempts}): {error}")
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("subscription", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(
+                fields=["active", "expires_in"], name="subscription_active_exp_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("subscription", "0002_subscription_active_expires_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaystackEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event_id", models.CharField(max_length=255, unique=True)),
+                ("event", models.CharField(max_length=100)),
+                ("payload", models.JSONField()),
+                ("received_on", models.DateTimeField(auto_now_add=True)),
+                ("processed_on", models.DateTimeField(blank=True, null=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("processed_on__isnull", True)),
+                        fields=["received_on"],
+                        name="paystackevent_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -5,14 +5,11 @@ from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.conf import settings
-import datetime
 from datetime import timedelta
 from datetime import datetime as dt
 
 from authentication.models import CustomUser
 
-today = datetime.date.today()
-
 
 # User Payment History
 class PayHistory(models.Model):
@@ -84,15 +81,37 @@ class Subscription(models.Model):
     expires_in = models.DateField(null=True, blank=True)
     active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Lets expire_subscriptions find active, expired rows by range scan.
+            models.Index(fields=['active', 'expires_in'],
+                         name='subscription_active_exp_idx'),
+        ]
+
     def __str__(self):
         return self.user_membership.user.username
 
 
-@receiver(post_save, sender=Subscription)
-def update_active(sender, instance, *args, **kwargs):
-    if instance.expires_in < today:
-        subscription = Subscription.objects.get(id=instance.id)
-        subscription.delete()
+# Paystack webhook inbox
+class PaystackEvent(models.Model):
+    # Paystack's event type and the id of the object it is about, so a
+    # redelivered event hits the unique constraint instead of a second row.
+    event_id = models.CharField(max_length=255, unique=True)
+    event = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_on = models.DateTimeField(auto_now_add=True)
+    processed_on = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['received_on'], name='paystackevent_pending_idx',
+                         condition=models.Q(processed_on__isnull=True)),
+        ]
+
+    def __str__(self):
+        return self.event_id
 
 
 class Card(models.Model):
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class PaystackUnavailable(requests.exceptions.RequestException):
+    """Raised without calling Paystack while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for ``reset_timeout`` seconds after
+    ``failure_threshold`` consecutive failures. Once that time is up a
+    single trial call is let through; its outcome closes the circuit or
+    opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Let this caller try, and hold everyone else off until the
+            # trial call has reported back.
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(
+                        f"Paystack circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+class EndpointMetrics:
+    """Call counts and latency for one Paystack endpoint."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'average_ms': round(1000 * self.total_seconds / self.calls, 1) if self.calls else None,
+            'max_ms': round(1000 * self.max_seconds, 1),
+        }
+
+
+class PaystackClient:
+    """
+    Paystack API client shared by every request in the process.
+
+    Calls go over one pooled keep-alive session with connect and read
+    timeouts. Connection errors are retried for every call, since nothing
+    reached Paystack, but 5xx responses and read errors are only retried
+    for GETs: retrying a POST could charge a card twice. Retries back off
+    exponentially with jitter.
+
+    Timeouts, connection errors and 5xx responses count towards the
+    circuit breaker; while it is open calls fail fast with
+    PaystackUnavailable instead of tying up a worker.
+    """
+
+    def __init__(self, base_url=None, secret_key=None, timeout=None, max_retries=None,
+                 failure_threshold=None, reset_timeout=None, pool_size=None):
+        self.base_url = (base_url or settings.PAYSTACK_BASE_URL).rstrip('/')
+        self.secret_key = secret_key if secret_key is not None else settings.PAYSTACK_SECRET_KEY
+        self.timeout = timeout or settings.PAYSTACK_TIMEOUT
+        max_retries = settings.PAYSTACK_MAX_RETRIES if max_retries is None else max_retries
+        self.breaker = CircuitBreaker(
+            failure_threshold or settings.PAYSTACK_BREAKER_THRESHOLD,
+            settings.PAYSTACK_BREAKER_RESET if reset_timeout is None else reset_timeout)
+        self.metrics = {}
+        self.metrics_lock = threading.Lock()
+
+        retry = Retry(
+            total=max_retries, connect=max_retries, read=max_retries,
+            status=max_retries, other=0,
+            allowed_methods=frozenset(['GET']),
+            status_forcelist=(502, 503, 504),
+            backoff_factor=0.2, backoff_jitter=0.2,
+            raise_on_status=False, respect_retry_after_header=False)
+        pool_size = pool_size or settings.PAYSTACK_POOL_SIZE
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, path, endpoint=None, **kwargs):
+        """
+        Call ``path`` on the Paystack API and return the response.
+        ``endpoint`` names the call in the metrics and defaults to ``path``.
+        """
+        endpoint = endpoint or path
+        stats = self.get_endpoint_metrics(endpoint)
+        if not self.breaker.allow_request():
+            with self.metrics_lock:
+                stats.rejected += 1
+            raise PaystackUnavailable("Paystack is unavailable, try again shortly.")
+
+        headers = {'Authorization': f'Bearer {self.secret_key}'}
+        headers.update(kwargs.pop('headers', {}))
+        start = time.monotonic()
+        try:
+            response = self.session.request(
+                method, f'{self.base_url}/{path.lstrip("/")}',
+                headers=headers, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            self.record_call(endpoint, stats, start, failed=True)
+            raise
+        self.record_call(endpoint, stats, start, failed=response.status_code >= 500)
+        return response
+
+    def get_endpoint_metrics(self, endpoint):
+        with self.metrics_lock:
+            return self.metrics.setdefault(endpoint, EndpointMetrics())
+
+    def record_call(self, endpoint, stats, start, failed):
+        elapsed = time.monotonic() - start
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        with self.metrics_lock:
+            stats.calls += 1
+            stats.errors += failed
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+        logger.debug(f"Paystack {endpoint} took {elapsed * 1000:.1f}ms (failed={failed})")
+
+    def get_metrics(self):
+        with self.metrics_lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self.metrics.items()}
+
+    def initialize_transaction(self, payload):
+        return self.request('POST', 'transaction/initialize', json=payload)
+
+    def verify_transaction(self, reference):
+        return self.request('GET', f'transaction/verify/{reference}',
+                            endpoint='transaction/verify')
+
+    def charge_authorization(self, payload):
+        return self.request('POST', 'transaction/charge_authorization', json=payload)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PaystackClient()
+    return _client
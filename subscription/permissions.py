@@ -0,0 +1,32 @@
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+from course.models import Course
+
+from .entitlements import has_active_subscription
+
+
+class HasActiveSubscription(BasePermission):
+    """
+    Course content can be read by staff, subscribers and the author of the
+    course it belongs to.
+
+    Subscriptions are checked against the cached entitlement, so the
+    common case costs no queries. Other users fall through to the author
+    check, for which the view names the Course lookup that reaches its
+    ``pk`` URL argument in ``subscription_course_lookup``, e.g. ``'module'``
+    for a module view. Views without one are open to subscribers only.
+    """
+    message = 'An active subscription is required to access this content.'
+
+    def has_permission(self, request, view):
+        if request.method not in SAFE_METHODS:
+            return True
+        user = request.user
+        if not user.is_authenticated:
+            return False
+        if user.is_staff or has_active_subscription(user):
+            return True
+        lookup = getattr(view, 'subscription_course_lookup', None)
+        if lookup is None or 'pk' not in view.kwargs:
+            return False
+        return Course.objects.filter(user=user, **{lookup: view.kwargs['pk']}).exists()
@@ -1,3 +1,300 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import CustomUser
+from course.models import Assignment, Course, Module
+from mailer.models import OutboxEmail
+
+from . import paystack
+from .entitlements import get_entitlement, has_active_subscription
+from .models import Card, Membership, PayHistory, PaystackEvent, Subscription, UserMembership
+
+
+class ExpireSubscriptionsTests(TestCase):
+    def setUp(self):
+        self.membership = Membership.objects.create(duration=30)
+        self.today = timezone.localdate()
+
+    def subscribe(self, email, days_left):
+        user = CustomUser.objects.create_user(email=email, password='password')
+        user_membership = UserMembership.objects.create(
+            user=user, membership=self.membership)
+        subscription = Subscription.objects.get(user_membership=user_membership)
+        Subscription.objects.filter(pk=subscription.pk).update(
+            expires_in=self.today + timedelta(days=days_left))
+        return subscription
+
+    def expire_subscriptions(self):
+        call_command('expire_subscriptions', '--batch-size', '2', stdout=StringIO())
+
+    def expiry_emails(self):
+        return OutboxEmail.objects.filter(subject="Subscription Expired!")
+
+    def test_expired_subscriptions_are_deactivated_and_notified(self):
+        expired = [self.subscribe(f'lapsed{i}@example.com', -1) for i in range(3)]
+        current = self.subscribe('current@example.com', 0)
+
+        self.expire_subscriptions()
+
+        self.assertFalse(Subscription.objects.filter(
+            pk__in=[s.pk for s in expired], active=True).exists())
+        current.refresh_from_db()
+        self.assertTrue(current.active)
+        self.assertEqual(
+            sorted(email.to[0] for email in self.expiry_emails()),
+            [f'lapsed{i}@example.com' for i in range(3)])
+
+        self.expire_subscriptions()
+        self.assertEqual(self.expiry_emails().count(), 3)
+
+    def test_renewed_members_are_not_notified(self):
+        old = self.subscribe('renewed@example.com', -1)
+        Subscription.objects.create(user_membership=old.user_membership,
+                                    expires_in=self.today + timedelta(days=30))
+
+        self.expire_subscriptions()
+
+        old.refresh_from_db()
+        self.assertFalse(old.active)
+        self.assertFalse(self.expiry_emails().exists())
+
+    def test_new_subscription_queues_welcome_email(self):
+        self.subscribe('new@example.com', 30)
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.subject, email.to), ("Subscribed!", ['new@example.com']))
+
+
+class EntitlementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='student@example.com', password='password')
+        self.membership = Membership.objects.create(
+            membership_type='Premium', duration=30)
+
+    def test_entitlement_is_cached_until_membership_changes(self):
+        self.assertFalse(has_active_subscription(self.user))
+        with self.assertNumQueries(0):
+            self.assertFalse(has_active_subscription(self.user))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserMembership.objects.create(user=self.user, membership=self.membership)
+
+        self.assertTrue(has_active_subscription(self.user))
+        self.assertEqual(get_entitlement(self.user.pk).membership_type, 'Premium')
+
+    def test_expired_entitlement_is_not_active(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            UserMembership.objects.create(user=self.user, membership=self.membership)
+            Subscription.objects.update(
+                expires_in=timezone.localdate() - timedelta(days=1))
+
+        self.assertFalse(has_active_subscription(self.user))
+
+    def test_course_content_requires_subscription(self):
+        author = CustomUser.objects.create_user(
+            email='author@example.com', password='password')
+        course = Course.objects.create(
+            user=author, course_title='Course', banner_image='banner.png',
+            modules=0, class_per_modules=1)
+        url = reverse('course-tree', kwargs={'pk': course.id})
+        client = APIClient()
+
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(url).status_code, 403)
+        client.force_authenticate(author)
+        self.assertEqual(client.get(url).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserMembership.objects.create(user=self.user, membership=self.membership)
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(url).status_code, 200)
+
+    def test_authors_only_bypass_the_paywall_for_their_own_courses(self):
+        author = CustomUser.objects.create_user(
+            email='author@example.com', password='password')
+        # self.user authors a course too, which must not unlock this one.
+        course, _own_course = [Course.objects.create(
+            user=user, course_title='Course', banner_image='banner.png',
+            modules=1, class_per_modules=1) for user in (author, self.user)]
+        module = Module.objects.create(course=course, title='Module')
+        assignment = Assignment.objects.create(module=module, title='Assignment')
+        urls = [
+            reverse('course-detail', kwargs={'pk': course.id}),
+            reverse('course-tree', kwargs={'pk': course.id}),
+            reverse('module-detail', kwargs={'pk': module.id}),
+            reverse('assignment-detail', kwargs={'pk': assignment.id}),
+            reverse('assignment-list', kwargs={'pk': module.id}),
+        ]
+        client = APIClient()
+
+        client.force_authenticate(self.user)
+        self.assertEqual([client.get(url).status_code for url in urls], [403] * len(urls))
+        client.force_authenticate(author)
+        self.assertEqual([client.get(url).status_code for url in urls], [200] * len(urls))
+
+
+class StubPaystackHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.respond()
+
+    def respond(self):
+        self.server.requests.append((self.command, self.path))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = json.dumps({'status': status == 200}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PaystackClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubPaystackHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = paystack.PaystackClient(
+            base_url=f'http://127.0.0.1:{self.server.server_port}', secret_key='sk_test',
+            timeout=(1, 1), max_retries=2, failure_threshold=2, reset_timeout=60)
+
+    def test_gets_are_retried_on_server_errors(self):
+        self.server.statuses = [503, 200]
+
+        response = self.client.verify_transaction('ref_1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests, [('GET', '/transaction/verify/ref_1')] * 2)
+        self.assertEqual(self.client.get_metrics()['transaction/verify']['calls'], 1)
+
+    def test_posts_are_not_retried(self):
+        self.server.statuses = [503]
+
+        response = self.client.charge_authorization({'amount': 100})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.statuses = [500, 500]
+        for _ in range(2):
+            self.client.initialize_transaction({'amount': 100})
+
+        with self.assertRaises(paystack.PaystackUnavailable):
+            self.client.initialize_transaction({'amount': 100})
+
+        self.assertEqual(len(self.server.requests), 2)
+        metrics = self.client.get_metrics()['transaction/initialize']
+        self.assertEqual((metrics['calls'], metrics['errors'], metrics['rejected']),
+                         (2, 2, 1))
+
+
+@override_settings(PAYSTACK_SECRET_KEY='sk_test')
+class PaystackWebhookTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='payer@example.com', password='password')
+        self.membership = Membership.objects.create(
+            membership_type='Premium', duration=30, price=5000)
+        self.url = reverse('subscription:paystack-webhook')
+
+    def charge_success(self, transaction_id, reference, amount=500000):
+        return {'event': 'charge.success', 'data': {
+            'id': transaction_id, 'reference': reference, 'amount': amount,
+            'customer': {'email': 'Payer@example.com'},
+            'metadata': {'membership': str(self.membership.pk)},
+            'authorization': {
+                'authorization_code': 'AUTH_1', 'card_type': 'visa', 'last4': '4081',
+                'exp_month': '12', 'exp_year': '2030', 'bin': '408408', 'bank': 'Test Bank',
+                'channel': 'card', 'signature': 'SIG_1', 'reusable': True,
+                'country_code': 'NG', 'account_name': None,
+            },
+        }}
+
+    def deliver(self, event, signature=None):
+        body = json.dumps(event).encode()
+        if signature is None:
+            signature = hmac.new(b'sk_test', body, hashlib.sha512).hexdigest()
+        return self.client.post(self.url, body, content_type='application/json',
+                                headers={'X-Paystack-Signature': signature})
+
+    def process_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_paystack_events', '--once', stdout=StringIO())
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.deliver(self.charge_success(1, 'ref_1'), signature='forged')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaystackEvent.objects.exists())
+
+    def test_redelivered_event_is_stored_once(self):
+        for _ in range(2):
+            self.assertEqual(self.deliver(self.charge_success(1, 'ref_1')).status_code, 200)
+
+        self.assertEqual(PaystackEvent.objects.count(), 1)
+
+    def test_charge_success_records_payment_card_and_membership(self):
+        self.deliver(self.charge_success(1, 'ref_1'))
+        self.deliver(self.charge_success(2, 'ref_2'))
+
+        self.process_events()
+
+        self.assertFalse(PaystackEvent.objects.filter(processed_on__isnull=True).exists())
+        self.assertEqual(PayHistory.objects.filter(user=self.user, paid=True).count(), 2)
+        self.assertEqual(Card.objects.filter(user_id=self.user).count(), 1)
+        self.assertEqual(UserMembership.objects.get(user=self.user).membership, self.membership)
+        self.assertTrue(has_active_subscription(self.user))
+
+    def test_underpaid_charge_does_not_switch_membership(self):
+        self.deliver(self.charge_success(1, 'ref_1', amount=100))
+
+        with self.assertLogs('subscription.webhooks', 'WARNING'):
+            self.process_events()
+
+        self.assertTrue(PayHistory.objects.get(paystack_charge_id='ref_1').paid)
+        self.assertFalse(UserMembership.objects.filter(user=self.user).exists())
+        self.assertFalse(has_active_subscription(self.user))
+
+    def test_initialize_charges_the_membership_price(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('subscription:initialize-transaction')
+
+        with mock.patch.object(paystack, 'get_client') as get_client:
+            get_client.return_value.initialize_transaction.return_value = mock.Mock(
+                status_code=200, json=lambda: {'status': True})
+            response = client.post(url, {
+                'email': 'payer@example.com', 'amount': 100, 'membership': self.membership.pk})
+            unknown = client.post(url, {
+                'email': 'payer@example.com', 'amount': 100, 'membership': 'premium'})
+
+        self.assertEqual((response.status_code, unknown.status_code), (200, 400))
+        get_client.return_value.initialize_transaction.assert_called_once_with({
+            'email': 'payer@example.com', 'amount': 500000,
+            'metadata': {'membership': self.membership.pk}})
@@ -9,4 +9,6 @@ urlpatterns = [
          VerifyTransactionView.as_view(), name='verify-transaction'),
     path('charge-authorization/', ChargeAuthorizationView.as_view(),
          name='charge-authorization'),
+    path('paystack/webhook/', PaystackWebhookView.as_view(),
+         name='paystack-webhook'),
 ]
@@ -1,4 +1,3 @@
-import os
 from datetime import timedelta
 from uuid import uuid4
 from django.contrib.auth import get_user_model
@@ -6,9 +5,11 @@ from django.shortcuts import get_object_or_404
 from dotenv import load_dotenv
 import requests
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from . import paystack
+from .webhooks import record_event, save_cards, verify_signature
 from .models import *
 from .serializers import *
 
@@ -26,23 +27,31 @@ class InitializeTransactionView(APIView):
     def post(self, request):
         email = request.data.get('email')
         amount = request.data.get('amount')
+        membership_id = request.data.get('membership')
+
+        membership = None
+        if membership_id:
+            try:
+                membership = Membership.objects.get(pk=membership_id)
+            except (Membership.DoesNotExist, ValueError):
+                return Response({"message": "Membership not found."}, status=status.HTTP_400_BAD_REQUEST)
+            # Memberships are charged their price in kobo, whatever the
+            # client sent.
+            amount = int(membership.price * 100)
 
         if not email or not amount:
             return Response({"message": "Email and amount are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        url = 'https://api.paystack.co/transaction/initialize'
-        token = os.environ.get('PAYSTACK_SECRET_KEY')
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
         payload = {
             "email": email,
             "amount": amount
         }
+        if membership is not None:
+            # Read back by the charge.success webhook to start the membership.
+            payload['metadata'] = {"membership": membership.pk}
 
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = paystack.get_client().initialize_transaction(payload)
             response_data = response.json()
             if response.status_code == 200:
                 return Response(response_data, status=status.HTTP_200_OK)
@@ -54,14 +63,8 @@ class InitializeTransactionView(APIView):
 
 class VerifyTransactionView(APIView):
     def get(self, request, reference):
-        url = f'https://api.paystack.co/transaction/verify/{reference}'
-        token = os.environ.get('PAYSTACK_SECRET_KEY')
-        headers = {
-            'Authorization': f'Bearer {token}',
-        }
-
         try:
-            response = requests.get(url, headers=headers)
+            response = paystack.get_client().verify_transaction(reference)
             response_data = response.json()
             if response.status_code == 200 and response_data['status']:
                 authorization_data = response_data['data']['authorization']
@@ -70,23 +73,8 @@ class VerifyTransactionView(APIView):
                 user_id = request.user.id
                 user = get_object_or_404(CustomUser, id=user_id)
 
-                card = Card.objects.create(
-                    user_id=user,
-                    authorization_code=authorization_data['authorization_code'],
-                    card_type=authorization_data['card_type'],
-                    last4=authorization_data['last4'],
-                    exp_month=authorization_data['exp_month'],
-                    exp_year=authorization_data['exp_year'],
-                    bin=authorization_data['bin'],
-                    bank=authorization_data['bank'],
-                    channel=authorization_data['channel'],
-                    signature=authorization_data['signature'],
-                    reusable=authorization_data['reusable'],
-                    country_code=authorization_data['country_code'],
-                    account_name=authorization_data['account_name'] or ''
-                )
-
-                card.save()
+                # Verifying the same transaction again must not add the card twice.
+                save_cards([(user, authorization_data)])
                 return Response(response_data, status=status.HTTP_200_OK)
             else:
                 return Response(response_data, status=response.status_code)
@@ -99,12 +87,6 @@ class ChargeAuthorizationView(APIView):
 
     def post(self, request):
         card = get_object_or_404(Card, user_id=request.user)
-        url = 'https://api.paystack.co/transaction/charge_authorization'
-        token = os.environ.get('PAYSTACK_SECRET_KEY')
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
         payload = {
             "email": request.data.get("email"),
             "amount": request.data.get("amount"),
@@ -112,7 +94,7 @@ class ChargeAuthorizationView(APIView):
         }
 
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = paystack.get_client().charge_authorization(payload)
             response_data = response.json()
             if response.status_code == 200:
                 return Response(response_data, status=status.HTTP_200_OK)
@@ -120,3 +102,23 @@ class ChargeAuthorizationView(APIView):
                 return Response(response_data, status=response.status_code)
         except requests.exceptions.RequestException as e:
             return Response({"message": "An error occurred while connecting to Paystack.", "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class PaystackWebhookView(APIView):
+    """
+    Receives Paystack webhooks. Events are only stored here and are applied
+    by the ``process_paystack_events`` worker, so Paystack gets its 200
+    straight away.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        body = request.body
+        if not verify_signature(body, request.headers.get('X-Paystack-Signature')):
+            return Response({"message": "Invalid signature."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            record_event(body)
+        except ValueError:
+            return Response({"message": "Invalid payload."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_200_OK)
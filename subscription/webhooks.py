@@ -0,0 +1,154 @@
+import hashlib
+import hmac
+import json
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+
+from authentication.models import CustomUser
+
+from .models import Card, Membership, PayHistory, PaystackEvent, UserMembership
+
+logger = logging.getLogger(__name__)
+
+
+def verify_signature(body, signature):
+    """Check the ``X-Paystack-Signature`` header against the raw body."""
+    if not signature or not settings.PAYSTACK_SECRET_KEY:
+        return False
+    expected = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(),
+                        body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def get_event_id(payload, body):
+    data = payload.get('data')
+    if isinstance(data, dict) and data.get('id') is not None:
+        return f"{payload.get('event')}:{data['id']}"
+    return hashlib.sha256(body).hexdigest()
+
+
+def record_event(body):
+    """
+    Add a webhook delivery to the inbox. Returns False if Paystack had
+    already delivered the event.
+    """
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Webhook payload must be a JSON object.")
+    _event, created = PaystackEvent.objects.get_or_create(
+        event_id=get_event_id(payload, body),
+        defaults={'event': payload.get('event', ''), 'payload': payload})
+    return created
+
+
+def card_kwargs(authorization):
+    return {
+        'authorization_code': authorization['authorization_code'],
+        'card_type': authorization['card_type'],
+        'last4': authorization['last4'],
+        'exp_month': authorization['exp_month'],
+        'exp_year': authorization['exp_year'],
+        'bin': authorization['bin'],
+        'bank': authorization['bank'],
+        'channel': authorization['channel'],
+        'signature': authorization['signature'],
+        'reusable': authorization['reusable'],
+        'country_code': authorization['country_code'],
+        'account_name': authorization['account_name'] or '',
+    }
+
+
+def save_cards(authorizations):
+    """
+    Store the card behind each ``(user, authorization)`` pair once.
+
+    Paystack gives every card the same ``signature`` on each charge, so a
+    card the user already has is not stored again.
+    """
+    authorizations = [(user, authorization) for user, authorization in authorizations
+                      if authorization and authorization.get('signature')]
+    if not authorizations:
+        return []
+    lookup = Q()
+    for user, authorization in authorizations:
+        lookup |= Q(user_id=user, signature=authorization['signature'])
+    seen = set(Card.objects.filter(lookup).values_list('user_id', 'signature'))
+    cards = []
+    for user, authorization in authorizations:
+        key = (user.pk, authorization['signature'])
+        if key not in seen:
+            seen.add(key)
+            cards.append(Card(user_id=user, **card_kwargs(authorization)))
+    return Card.objects.bulk_create(cards)
+
+
+def get_membership_id(charge):
+    membership = (charge.get('metadata') or {}).get('membership')
+    return int(membership) if str(membership).isdigit() else None
+
+
+def handle_charge_success(events):
+    """
+    Mark the charges paid, store the cards used and move each payer onto
+    the membership they paid for, a batch of events at a time. Charges for
+    less than the membership's price are recorded but don't switch it.
+    """
+    charges = {event.payload['data']['reference']: event.payload['data']
+               for event in events}
+    emails = Q()
+    for charge in charges.values():
+        emails |= Q(email__iexact=charge['customer']['email'])
+    users = {user.email.lower(): user for user in CustomUser.objects.filter(emails)}
+    histories = {history.paystack_charge_id: history
+                 for history in PayHistory.objects.select_related('user', 'payment_for')
+                 .filter(paystack_charge_id__in=charges)}
+    existing_histories = list(histories.values())
+    # The membership being paid for is passed in the transaction metadata
+    # by InitializeTransactionView.
+    membership_ids = {get_membership_id(charge) for charge in charges.values()} - {None}
+    memberships = Membership.objects.in_bulk(membership_ids)
+
+    new_histories = []
+    authorizations = []
+    for reference, charge in charges.items():
+        user = users.get(charge['customer']['email'].lower())
+        if user is None:
+            continue
+        history = histories.get(reference)
+        if history is None:
+            history = histories[reference] = PayHistory(
+                user=user, paystack_charge_id=reference,
+                payment_for=memberships.get(get_membership_id(charge)),
+                amount=Decimal(charge['amount']) / 100)
+            new_histories.append(history)
+        history.paid = True
+        authorizations.append((user, charge.get('authorization')))
+
+    PayHistory.objects.bulk_create(new_histories)
+    PayHistory.objects.bulk_update(existing_histories, ['paid'])
+    save_cards(authorizations)
+
+    for reference, history in histories.items():
+        if history.payment_for_id is None:
+            continue
+        # The metadata comes from the client, so only a charge that covers
+        # the membership's price may move the payer onto it.
+        if history.amount < history.payment_for.price:
+            logger.warning(
+                f"Charge {reference} paid {history.amount}, less than the "
+                f"{history.payment_for.price} price of membership {history.payment_for_id}; "
+                f"not switching {history.user.email}")
+            continue
+        # Saved one at a time: the post_save signals start the
+        # subscription and refresh the cached entitlement.
+        UserMembership.objects.update_or_create(
+            user=history.user, defaults={
+                'membership': history.payment_for, 'reference_code': reference})
+
+
+EVENT_HANDLERS = {
+    'charge.success': handle_charge_success,
+}
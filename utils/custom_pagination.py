@@ -1,6 +1,16 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+
 from django.core.paginator import Paginator, EmptyPage
+from django.db.models import DateTimeField, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
 from rest_framework.response import Response
 
+from exceptions.custom_apiexception_class import CustomAPIException
 from utils.custom_response import custom_response
 
 
@@ -28,3 +38,118 @@ class CustomPagination:
             'num_pages': self.page.paginator.num_pages,
             'results': data
         })
+
+
+class CursorPagination:
+    """
+    Keyset pagination over ``(ordering_field, id)``, highest first.
+
+    Pages are fetched with a ``WHERE (ordering_field, id) < cursor`` seek
+    instead of OFFSET, and no COUNT query is issued, so every page costs the
+    same no matter how deep the client scrolls. Cursors are opaque base64
+    tokens. ``ordering_field`` defaults to ``created_on`` (newest first) and
+    may be any datetime or numeric field.
+    """
+    page_size = 24
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_field = 'created_on'
+
+    def __init__(self, ordering_field=None):
+        if ordering_field is not None:
+            self.ordering_field = ordering_field
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(
+                self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, instance, reverse=False):
+        value = getattr(instance, self.ordering_field)
+        payload = {
+            'f': self.ordering_field,
+            'k': value.isoformat() if isinstance(value, datetime) else value,
+            'i': str(instance.id),
+            'r': reverse,
+        }
+        raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, request, is_datetime=True, query_param=None):
+        encoded = request.query_params.get(
+            query_param or self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(
+                encoded.encode('ascii')).decode('utf-8'))
+            if payload['f'] != self.ordering_field:
+                raise ValueError(payload['f'])
+            value = payload['k']
+            if is_datetime:
+                value = parse_datetime(value)
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(value)
+            pk = uuid.UUID(payload['i'])
+            reverse = bool(payload.get('r', False))
+        except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+            value = None
+        if value is None:
+            raise CustomAPIException(
+                detail="Invalid cursor.", status_code=status.HTTP_400_BAD_REQUEST)
+        return value, pk, reverse
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        field = self.ordering_field
+        cursor = self.decode_cursor(request, isinstance(
+            queryset.model._meta.get_field(field), DateTimeField))
+
+        if cursor is None:
+            reverse = False
+            queryset = queryset.order_by(f'-{field}', '-id')
+        else:
+            value, pk, reverse = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+                ).order_by(field, 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+                ).order_by(f'-{field}', '-id')
+        # One extra row tells us whether another page exists without a COUNT.
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+
+        if reverse:
+            results.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.next_cursor = None
+        self.previous_cursor = None
+        if results:
+            if has_next:
+                self.next_cursor = self.encode_cursor(results[-1])
+            if has_previous:
+                self.previous_cursor = self.encode_cursor(
+                    results[0], reverse=True)
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data, message="Success"):
+        return custom_response(status_code=status.HTTP_200_OK, message=message, data={
+            'next': self.next_cursor,
+            'previous': self.previous_cursor,
+            'results': data
+        })